@@ -1,14 +1,22 @@
 # conductor_backend_yolo.py
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import sounddevice as sd
-import asyncio
 import threading
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import time
+import os
+import sys
+
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from flowstate.baton import PHONE_CLASS, AsyncBatonTracker, BeatCounter, DetectThenTrack, largest_box
+from flowstate.broadcaster import Broadcaster
+from flowstate.capture import LatestFrameGrabber, open_capture
+from flowstate.event_bus import EventBus
+from flowstate.inference import load_backend
+from flowstate.mixer import Mixer
 
 # ---------------- CONFIG ----------------
 FS = 44100
@@ -16,120 +24,135 @@ CLICK_DURATION = 0.02
 CLICK_FREQ = 1500
 SMOOTHING = 5
 MIN_FRAMES_BETWEEN_CLICKS = 5
+DETECT_THEN_TRACK = True  # run YOLO every DETECT_EVERY frames and track with optical flow between
+DETECT_EVERY = 5
+# .pt runs through ultralytics; export once with
+#   python -m flowstate.inference export yolov8n.pt --format onnx --imgsz 320
+# and point this at yolov8n.onnx (or yolov8n_openvino_model/) for the faster CPU runtimes
+MODEL_PATH = "yolov8n.pt"
+INFER_SIZE = 320          # network input size; 640 is the ultralytics default
+INFER_THREADS = 4
+CLICK_LATENCY = 0.15      # extremum to click; covers one more frame plus inference
 
 # ---------------- CLICK SOUND ----------------
 t = np.linspace(0, CLICK_DURATION, int(FS * CLICK_DURATION), False)
 click_sound = (0.5 * np.sin(2 * np.pi * CLICK_FREQ * t)).astype(np.float32)
-def play_click():
-    sd.play(click_sound, FS, blocking=False)
+mixer = Mixer(fs=FS)
+mixer.start()
+
+def play_click(at=None):
+    """Click now, or at perf_counter() time `at`"""
+    mixer.play(click_sound, at=at)
 
 # ---------------- FastAPI + WebSocket ----------------
+# The tracker thread publishes beats on the event bus; one task on the
+# server loop drains it in order and hands each message to the clients
+# subscribed to its topic. Clients pick topics with ?topics=beat,downbeat
+# (all of beat, downbeat and status by default).
 app = FastAPI()
-clients = set()
+bus = EventBus()
+broadcaster = Broadcaster()
+last_status = "status:starting"  # replayed to clients that connect later
+
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
+async def websocket_endpoint(ws: WebSocket, topics: str = None):
+    bus.start()
     await ws.accept()
-    clients.add(ws)
+    wanted = [t for t in topics.split(",") if t] if topics else None
+    if wanted is not None and not set(wanted) <= set(bus.topics):
+        await ws.send_text(f"error:topics must be among {','.join(bus.topics)}")
+        await ws.close()
+        return
+    broadcaster.add(ws)
+    unsubscribe = bus.subscribe(lambda topic, message: broadcaster.send_to(ws, message), wanted)
+    if wanted is None or "status" in wanted:
+        broadcaster.send_to(ws, last_status)
     try:
         while True:
-            await asyncio.sleep(0.1)
-    except:
+            await ws.receive_text()
+    except WebSocketDisconnect:
         pass
     finally:
-        clients.remove(ws)
+        unsubscribe()
+        broadcaster.remove(ws)
 
-async def broadcast(message: str):
-    remove = set()
-    for ws in clients:
-        try:
-            await ws.send_text(message)
-        except:
-            remove.add(ws)
-    clients.difference_update(remove)
-
-def emit_message(message):
-    threading.Thread(target=lambda: asyncio.run(broadcast(message)), daemon=True).start()
+def emit_message(topic, message):
+    """Safe from any thread; never blocks the caller"""
+    global last_status
+    if topic == "status":
+        last_status = message
+    bus.publish(topic, message)
 
 # ---------------- Serve HTML dashboard ----------------
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
 # ---------------- YOLO Tracker ----------------
+# Capture (grabber thread) and inference (tracker thread) run apart: the
+# tracker always takes the newest frame, and each beat carries the capture
+# time of the frame where the phone was at the extremum. The click is
+# queued for that time plus a fixed CLICK_LATENCY, so its timing tracks
+# the gesture; if the CPU cannot keep up it plays as soon as possible.
+late_clicks = 0
+
+def on_beat(event):
+    global late_clicks
+    kind, number, t_extremum = event
+    due = t_extremum + CLICK_LATENCY
+    if due < time.perf_counter():
+        late_clicks += 1
+    play_click(at=due)
+    if kind == "downbeat":
+        print(f"Downbeat (new measure) {number}")
+        emit_message("downbeat", f"downbeat:{number}")
+    else:
+        print(f"Beat {number}")
+        emit_message("beat", f"beat:{number}")
+
 def run_yolo_tracker():
-    model = YOLO("yolov8n.pt")
-    y_history = []
-    x_history = []
-    measure_number = 1
-    current_beat = 0
-    last_click_frame = -MIN_FRAMES_BETWEEN_CLICKS
-    frame_counter = 0
-
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
+    # Pretrained COCO, with every class but the phone dropped inside the call
+    model = load_backend(MODEL_PATH, imgsz=INFER_SIZE, classes=[PHONE_CLASS], threads=INFER_THREADS)
+    model.warmup()
+
+    def detect_phone(frame):
+        boxes, _, classes = model(frame)
+        return largest_box(boxes, classes, PHONE_CLASS)
+
+    # Full detection every few frames, optical flow in between
+    locate = DetectThenTrack(detect_phone, detect_every=DETECT_EVERY).update if DETECT_THEN_TRACK else detect_phone
+
+    cap = open_capture(0)
+    if cap is None:
         print("Cannot open camera")
+        emit_message("status", "status:no-camera")
         return
 
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    x_center_range = (frame_width*0.4, frame_width*0.6)
-
-    def is_relative_extrema(history, idx):
-        if len(history) < 3:
-            return False
-        prev, curr, nxt = history[idx-1], history[idx], history[idx+1]
-        return (curr > prev and curr > nxt) or (curr < prev and curr < nxt)
+    beats = BeatCounter(frame_width, smoothing=SMOOTHING,
+                        min_frames_between_clicks=MIN_FRAMES_BETWEEN_CLICKS)
+    tracker = AsyncBatonTracker(LatestFrameGrabber(cap), locate, beats, on_event=on_beat).start()
+    emit_message("status", "status:tracking")
 
+    shown = None
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_counter += 1
-
-        results = model(frame, stream=False)
-        boxes = results[0].boxes.xyxy.cpu().numpy() if results else []
-        classes = results[0].boxes.cls.cpu().numpy() if results else []
-
-        phone_boxes = [b for i, b in enumerate(boxes) if int(classes[i]) == 67]
-
-        if phone_boxes:
-            b = max(phone_boxes, key=lambda bb: (bb[2]-bb[0])*(bb[3]-bb[1]))
-            x1, y1, x2, y2 = b
-            baton_x = (x1+x2)/2
-            baton_y = (y1+y2)/2
-
-            x_history.append(baton_x)
-            y_history.append(baton_y)
-            if len(x_history) > SMOOTHING: x_history.pop(0)
-            if len(y_history) > SMOOTHING: y_history.pop(0)
-            smooth_x = sum(x_history)/len(x_history)
-            smooth_y = sum(y_history)/len(y_history)
-
-            if frame_counter > 2 + last_click_frame:
-                y_ext = is_relative_extrema(y_history, -2)
-                x_ext = is_relative_extrema(x_history, -2)
-                if y_ext or x_ext:
-                    play_click()
-                    last_click_frame = frame_counter
-                    current_beat += 1
-
-                    if y_history[-2] == min(y_history[-3:]) and x_center_range[0] < smooth_x < x_center_range[1]:
-                        print(f"Downbeat (new measure) {measure_number}")
-                        emit_message(f"downbeat:{measure_number}")
-                        measure_number += 1
-                        current_beat = 1
-                    else:
-                        print(f"Beat {current_beat}")
-                        emit_message(f"beat:{current_beat}")
-
-            # Draw visuals
-            x1, y1, x2, y2 = map(int, b)
-            cv2.rectangle(frame, (x1,y1), (x2,y2), (0,255,0), 2)
-            cv2.circle(frame, (int(smooth_x), int(smooth_y)), 5, (0,0,255), -1)
-
-        cv2.imshow("Conductor Tracker", frame)
-        if cv2.waitKey(1) & 0xFF == 27:
+        result = tracker.latest
+        if result is not None and result is not shown:
+            shown = result
+            frame = result.frame.copy()
+            if result.box is not None and beats.smooth_x is not None:
+                # Draw visuals
+                x1, y1, x2, y2 = map(int, result.box)
+                cv2.rectangle(frame, (x1,y1), (x2,y2), (0,255,0), 2)
+                cv2.circle(frame, (int(beats.smooth_x), int(beats.smooth_y)), 5, (0,0,255), -1)
+            cv2.imshow("Conductor Tracker", frame)
+        if cv2.waitKey(10) & 0xFF == 27:
             break
 
-    cap.release()
+    tracker.stop()
+    emit_message("status", "status:stopped")
     cv2.destroyAllWindows()
+    print(model.timer.report())
+    print(f"Tracked {tracker.processed} frames, skipped {tracker.skipped}, "
+          f"capture-to-result {tracker.mean_latency() * 1e3:.0f} ms, {late_clicks} late clicks")
 
 # ---------------- Run YOLO tracker in a thread ----------------
 threading.Thread(target=run_yolo_tracker, daemon=True).start()
@@ -1,20 +1,17 @@
 # generate_measure_wavs.py
-import pyttsx3
+#   python generateMeasureNumbers.py                  # measures 101-300 into measure_wavs/
+#   python generateMeasureNumbers.py 1-500 --voice english --rate 170 --jobs 8
+# Only missing or changed files are rendered; see flowstate/measure_tts.py for all options.
 import os
+import sys
+
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from flowstate.measure_tts import main
 
 # ---------------- CONFIG ----------------
+MEASURES = "101-300"
 MEASURE_FOLDER = "measure_wavs"
-os.makedirs(MEASURE_FOLDER, exist_ok=True)
-
-# ---------------- INIT TTS ----------------
-engine = pyttsx3.init()
-engine.setProperty('rate', 150)  # speaking rate
 
-# ---------------- GENERATE WAV FILES ----------------
-for measure in range(101, 301):
-    filename = os.path.join(MEASURE_FOLDER, f"measure_{measure}.wav")
-    print(f"Generating {filename}...")
-    engine.save_to_file(f"Measure {measure}", filename)
-    
-engine.runAndWait()
-print("All measure files generated!")
+if __name__ == "__main__":
+    main(default_measures=MEASURES, default_out=MEASURE_FOLDER)
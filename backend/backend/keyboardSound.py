@@ -1,10 +1,13 @@
-import sounddevice as sd
 import numpy as np
 from pynput import keyboard
-from scipy.io import wavfile
-import threading
 import time
 import os
+import sys
+
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from flowstate.measure_synth import open_measure_audio
+from flowstate.mixer import Mixer
 
 # ===================== CONFIG =====================
 FS = 44100
@@ -12,34 +15,12 @@ BLOCKSIZE = 256
 MEASURE_INTERVAL = 4
 MEASURE_FOLDER = "measure_wavs"
 
-# ===================== AUDIO STATE =====================
-active_sounds = []
-audio_lock = threading.Lock()
-
-# ===================== AUDIO CALLBACK =====================
-def audio_callback(outdata, frames, time_info, status):
-    outdata[:] = 0
-
-    with audio_lock:
-        finished = []
-        for i, sound in enumerate(active_sounds):
-            data, pos = sound
-            remaining = len(data) - pos
-            n = min(remaining, frames)
-
-            outdata[:n, 0] += data[pos:pos+n]
-            sound[1] += n
-
-            if sound[1] >= len(data):
-                finished.append(i)
-
-        for i in reversed(finished):
-            active_sounds.pop(i)
+# ===================== AUDIO =====================
+mixer = Mixer(fs=FS, blocksize=BLOCKSIZE)
 
 # ===================== PLAY FUNCTION =====================
-def play(sound):
-    with audio_lock:
-        active_sounds.append([sound, 0])
+def play(sound, at=None):
+    mixer.play(sound, at=at)
 
 # ===================== CLICK GENERATION =====================
 def generate_click(freq, ms, amp=0.6):
@@ -50,15 +31,7 @@ click_downbeat = generate_click(1500, 25)
 click_other = generate_click(1000, 15)
 
 # ===================== LOAD MEASURE WAVS =====================
-measure_audio = {}
-for i in range(1, 101):
-    path = os.path.join(MEASURE_FOLDER, f"measure_{i}.wav")
-    if not os.path.exists(path):
-        continue
-    fs, data = wavfile.read(path)
-    if data.dtype == np.int16:
-        data = data.astype(np.float32) / 32768.0
-    measure_audio[i] = data
+measure_audio = open_measure_audio(MEASURE_FOLDER, sample_rate=FS)
 
 # ===================== STATE =====================
 last_time = 0
@@ -101,11 +74,6 @@ def on_press(key):
 print("Keyboard Conductor")
 print("↑ = downbeat | ↓ = other beats | ESC = quit")
 
-with sd.OutputStream(
-    samplerate=FS,
-    channels=1,
-    blocksize=BLOCKSIZE,
-    callback=audio_callback
-):
+with mixer.open_stream():
     with keyboard.Listener(on_press=on_press) as listener:
         listener.join()
@@ -5,6 +5,11 @@ import time
 from collections import deque
 import threading
 import os
+import sys
+
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from flowstate.segmentation import RoiTracker
 
 # ------------------- CONFIG -------------------
 FRAME_WIDTH = 640
@@ -53,7 +58,8 @@ cap = cv2.VideoCapture(0)
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
 
-# Wrist smoothing
+# Wrist tracking + smoothing
+tracker = RoiTracker()
 wrist_history = deque(maxlen=SMOOTHING_FRAMES)
 prev_time = None
 measure_count = input("Enter the number of the first measure (default 1): ")
@@ -72,28 +78,11 @@ while True:
     frame = cv2.flip(frame, 1)
 
     # ------------------- RED STICK DETECTION -------------------
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    lower_red1 = np.array([0, 120, 70])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([170, 120, 70])
-    upper_red2 = np.array([180, 255, 255])
-
-    mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
-    mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-    mask = cv2.bitwise_or(mask1, mask2)
-    mask = cv2.GaussianBlur(mask, (5,5), 0)
-
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    wrist_point = None
-
-    if contours:
-        cnt = max(contours, key=cv2.contourArea)
-        if cv2.contourArea(cnt) > 200:
-            hull = cv2.convexHull(cnt)
-            bottommost = tuple(hull[hull[:,:,1].argmax()][0])
-            wrist_point = (int(bottommost[0]), int(bottommost[1]))
-            wrist_history.append(wrist_point)
-            cv2.circle(frame, wrist_point, 6, (0,0,255), -1)
+    # Segments a window around the last wrist position, full frame when lost
+    wrist_point = tracker.locate(frame)
+    if wrist_point is not None:
+        wrist_history.append(wrist_point)
+        cv2.circle(frame, wrist_point, 6, (0,0,255), -1)
 
     # ------------------- SMOOTHING -------------------
     if len(wrist_history) >= 2:
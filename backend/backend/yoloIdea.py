@@ -1,8 +1,14 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import sounddevice as sd
 import time
+import os
+import sys
+
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from flowstate.baton import PHONE_CLASS, BeatCounter, DetectThenTrack, largest_box
+from flowstate.inference import load_backend
 
 # ---------------- CONFIG ----------------
 FS = 44100
@@ -10,6 +16,14 @@ CLICK_DURATION = 0.02  # 20ms click
 CLICK_FREQ = 1500
 SMOOTHING = 5          # frames moving average
 MIN_FRAMES_BETWEEN_CLICKS = 5
+DETECT_THEN_TRACK = True  # run YOLO every DETECT_EVERY frames and track with optical flow between
+DETECT_EVERY = 5
+# .pt runs through ultralytics; export once with
+#   python -m flowstate.inference export yolov8n.pt --format onnx --imgsz 320
+# and point this at yolov8n.onnx (or yolov8n_openvino_model/) for the faster CPU runtimes
+MODEL_PATH = "yolov8n.pt"
+INFER_SIZE = 320          # network input size; 640 is the ultralytics default
+INFER_THREADS = 4
 
 # ---------------- CLICK SOUND ----------------
 t = np.linspace(0, CLICK_DURATION, int(FS * CLICK_DURATION), False)
@@ -19,16 +33,20 @@ def play_click():
     sd.play(click_sound, FS, blocking=False)
 
 # ---------------- YOLO ----------------
-model = YOLO("yolov8n.pt")  # Pretrained COCO
+# Pretrained COCO, with every class but the phone dropped inside the call
+model = load_backend(MODEL_PATH, imgsz=INFER_SIZE, classes=[PHONE_CLASS], threads=INFER_THREADS)
+model.warmup()
+
+def detect_phone(frame):
+    boxes, _, classes = model(frame)
+    # Track only cell phone (COCO class 67)
+    return largest_box(boxes, classes, PHONE_CLASS)
+
+# Full detection every few frames, optical flow in between
+tracker = DetectThenTrack(detect_phone, detect_every=DETECT_EVERY) if DETECT_THEN_TRACK else None
 
 # ---------------- STATE ----------------
-y_history = []
-x_history = []
-measure_number = 1
-current_beat = 0
-last_click_frame = -MIN_FRAMES_BETWEEN_CLICKS
 frame_counter = 0
-frame_width = 640  # default, updated later
 
 # ---------------- VIDEO ----------------
 cap = cv2.VideoCapture(0)
@@ -37,69 +55,34 @@ if not cap.isOpened():
 
 frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-x_center_range = (frame_width * 0.4, frame_width * 0.6)  # horizontal center
+# Beats at relative extrema; downbeat = relative minimum y near the horizontal centre
+beats = BeatCounter(frame_width, smoothing=SMOOTHING,
+                    min_frames_between_clicks=MIN_FRAMES_BETWEEN_CLICKS)
 
 print("Conductor tracker (phone as baton). Press ESC to quit.")
 
-def is_relative_extrema(history, idx):
-    # Simple check: previous < current > next or previous > current < next
-    if len(history) < 3:
-        return False
-    prev, curr, nxt = history[idx-1], history[idx], history[idx+1]
-    return (curr > prev and curr > nxt) or (curr < prev and curr < nxt)
-
 while True:
     ret, frame = cap.read()
     if not ret:
         break
     frame_counter += 1
 
-    results = model(frame, stream=False)
-    boxes = results[0].boxes.xyxy.cpu().numpy() if results else []
-    classes = results[0].boxes.cls.cpu().numpy() if results else []
+    b = tracker.update(frame) if tracker is not None else detect_phone(frame)
 
-    # Track only cell phone (COCO class 67)
-    phone_boxes = [b for i, b in enumerate(boxes) if int(classes[i]) == 67]
-
-    if phone_boxes:
-        b = max(phone_boxes, key=lambda bb: (bb[2]-bb[0])*(bb[3]-bb[1]))
-        x1, y1, x2, y2 = b
-        baton_x = (x1 + x2)/2
-        baton_y = (y1 + y2)/2
-
-        # Smooth
-        x_history.append(baton_x)
-        y_history.append(baton_y)
-        if len(x_history) > SMOOTHING:
-            x_history.pop(0)
-        if len(y_history) > SMOOTHING:
-            y_history.pop(0)
-        smooth_x = sum(x_history)/len(x_history)
-        smooth_y = sum(y_history)/len(y_history)
-
-        # Detect relative extrema
-        if frame_counter > 2 + last_click_frame:
-            # Need at least 3 points
-            y_ext = is_relative_extrema(y_history, -2)  # -2 = middle of last 3
-            x_ext = is_relative_extrema(x_history, -2)
-            if y_ext or x_ext:
-                play_click()
-                last_click_frame = frame_counter
-                current_beat += 1
-
-                # Check if downbeat (new measure)
-                # Relative minimum y + horizontal near center
-                if y_history[-2] == min(y_history[-3:]) and x_center_range[0] < smooth_x < x_center_range[1]:
-                    print(f"Downbeat (new measure) {measure_number}")
-                    measure_number += 1
-                    current_beat = 1
-                else:
-                    print(f"Beat {current_beat}")
+    if b is not None:
+        event = beats.update(frame_counter, b)
+        if event is not None:
+            play_click()
+            kind, number, _ = event
+            if kind == "downbeat":
+                print(f"Downbeat (new measure) {number}")
+            else:
+                print(f"Beat {number}")
 
         # Draw visuals
         x1, y1, x2, y2 = map(int, b)
         cv2.rectangle(frame, (x1, y1), (x2, y2), (0,255,0), 2)
-        cv2.circle(frame, (int(smooth_x), int(smooth_y)), 5, (0,0,255), -1)
+        cv2.circle(frame, (int(beats.smooth_x), int(beats.smooth_y)), 5, (0,0,255), -1)
 
     cv2.imshow("Conductor Tracker (Phone)", frame)
     if cv2.waitKey(1) & 0xFF == 27:
@@ -107,3 +90,4 @@ while True:
 
 cap.release()
 cv2.destroyAllWindows()
+print(model.timer.report())
@@ -0,0 +1,5 @@
+# Shared building blocks for the Flowstate metronome servers and scripts.
+#
+# The project folders (measureDetectorProject, keyboardConductorProject,
+# backend/...) are run from their own directory, so each entry script puts
+# the repo root on sys.path before importing from here.
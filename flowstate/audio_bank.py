@@ -0,0 +1,219 @@
+"""Packed, memory-mapped bank of measure announcements.
+
+One file replaces a folder of measure_N.wav files:
+
+    header   magic "FSBANK1\\0" | version u32 | sample_rate u32 | count u32 | pad u32 | source digest 16s
+    index    count x (measure u32 | length u32 | offset u64)   offsets in samples
+    payload  int16 mono samples, 64-byte aligned
+
+The payload is opened with np.memmap, so every process on the box shares
+the same page-cache pages. Measures are converted to float32 only when
+they are asked for, and only a few recent ones are kept.
+
+A bank built for a sample rate holds every cue already resampled to it,
+downmixed, trimmed and loudness-normalized (see cue_prep), so clips play
+at the right pitch on a stream of that rate with no work per playback.
+Each rate gets its own bank file next to the plain one.
+
+    python -m flowstate.audio_bank measureDetectorProject/measure_wavs --rate 44100
+"""
+import argparse
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.io import wavfile
+
+from flowstate.cue_prep import PREP_VERSION, CueCache
+
+# ================= CONFIG =================
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_BANK_PATH = os.path.join(REPO_ROOT, "measure_bank.fsb")
+CACHE_SIZE = 16
+DEVICE_RATE = 44100  # what the servers' output streams run at
+
+MAGIC = b"FSBANK1\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIII16s")
+ENTRY = struct.Struct("<IIQ")
+ALIGN = 64
+
+# ================= BUILD =================
+def list_measure_wavs(wav_dir):
+    """{measure number: path} for every measure_N.wav in a folder"""
+    files = {}
+    for file_name in os.listdir(wav_dir):
+        if file_name.startswith("measure_") and file_name.endswith(".wav"):
+            measure_num = int(file_name.split("_")[1].split(".")[0])
+            files[measure_num] = os.path.join(wav_dir, file_name)
+    return files
+
+def bank_path(sample_rate=None, path=DEFAULT_BANK_PATH):
+    """Bank file for a target rate: measure_bank.44100.fsb next to measure_bank.fsb"""
+    if sample_rate is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{sample_rate}{ext}"
+
+def source_digest(files, sample_rate=None):
+    """Fingerprint of a WAV folder (names, sizes and contents, not mtimes, so
+    identical copies of the folder share one bank) and of the processing a
+    bank for `sample_rate` applies to it"""
+    h = hashlib.blake2b(digest_size=16)
+    if sample_rate is not None:
+        h.update(f"rate {sample_rate} prep {PREP_VERSION};".encode())
+    for num in sorted(files):
+        with open(files[num], "rb") as f:
+            data = f.read()
+        h.update(f"{num}:{len(data)}:".encode())
+        h.update(hashlib.blake2b(data, digest_size=16).digest())
+    return h.digest()
+
+def to_int16_mono(data):
+    if data.ndim > 1:
+        data = data[:, 0]  # stereo -> mono
+    if data.dtype == np.int16:
+        return data
+    if data.dtype.kind == "f":
+        return (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+    # Other integer widths: keep the top 16 bits
+    shift = data.dtype.itemsize * 8 - 16
+    return (data.astype(np.int64) >> shift).astype(np.int16) if shift > 0 else data.astype(np.int16)
+
+def write_bank(path, sample_rate, clips, digest=b""):
+    """Write {measure: int16 mono array} to `path` atomically"""
+    nums = sorted(clips)
+    payload_start = HEADER.size + ENTRY.size * len(nums)
+    payload_start += -payload_start % ALIGN
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, sample_rate, len(nums), 0, digest.ljust(16, b"\0")))
+        offset = 0
+        for num in nums:
+            f.write(ENTRY.pack(num, len(clips[num]), offset))
+            offset += len(clips[num])
+        f.write(b"\0" * (payload_start - f.tell()))
+        for num in nums:
+            f.write(np.ascontiguousarray(clips[num], dtype="<i2").tobytes())
+    os.replace(tmp_path, path)
+
+def build_bank(wav_dir, path=DEFAULT_BANK_PATH, sample_rate=None, cache=None):
+    """One-time conversion of a measure_wavs folder into a bank file.
+
+    With `sample_rate` every cue is prepared for that rate through a
+    CueCache, so a rebuild only processes files it has not seen before.
+    Without it the samples are stored as they are, at the folder's rate.
+    """
+    files = list_measure_wavs(wav_dir)
+    if not files:
+        raise FileNotFoundError(f"No measure_N.wav files in {wav_dir}")
+    clips = {}
+    if sample_rate is not None:
+        cache = cache or CueCache(sample_rate)
+        for num, wav_path in files.items():
+            clips[num] = cache.load(wav_path)
+        print(f"Prepared {len(clips)} cues for {sample_rate} Hz "
+              f"({cache.misses} processed, {cache.hits} from {cache.directory})")
+        digest = source_digest(files, sample_rate)
+    else:
+        for num, wav_path in files.items():
+            fs_data, data = wavfile.read(wav_path)
+            if sample_rate is None:
+                sample_rate = fs_data
+            elif fs_data != sample_rate:
+                raise ValueError(f"{wav_path} is {fs_data} Hz, expected {sample_rate} Hz")
+            clips[num] = to_int16_mono(data)
+        digest = source_digest(files)
+    write_bank(path, sample_rate, clips, digest)
+    print(f"Built audio bank {path}: {len(clips)} measures at {sample_rate} Hz")
+    return path
+
+# ================= READ =================
+class AudioBank:
+    """Read-only, dict-like view of a bank file: bank[measure] -> float32 array"""
+
+    def __init__(self, path=DEFAULT_BANK_PATH, cache_size=CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+
+        magic, version, self.sample_rate, count, _, self.digest = HEADER.unpack_from(raw, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} audio bank")
+        entries = np.frombuffer(raw, dtype=np.dtype([("num", "<u4"), ("length", "<u4"), ("offset", "<u8")]),
+                                count=count, offset=HEADER.size)
+        self.index = {int(e["num"]): (int(e["offset"]), int(e["length"])) for e in entries}
+
+        payload_start = HEADER.size + ENTRY.size * count
+        payload_start += -payload_start % ALIGN
+        self.samples = np.memmap(path, dtype="<i2", mode="r", offset=payload_start)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def raw(self, num):
+        """Zero-copy int16 view of one measure"""
+        offset, length = self.index[num]
+        return self.samples[offset:offset + length]
+
+    def __getitem__(self, num):
+        with self._lock:
+            data = self._cache.get(num)
+            if data is not None:
+                self._cache.move_to_end(num)
+                return data
+        data = self.raw(num).astype(np.float32) / 32768.0
+        with self._lock:
+            self._cache[num] = data
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def get(self, num, default=None):
+        return self[num] if num in self.index else default
+
+    def __contains__(self, num):
+        return num in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return sorted(self.index)
+
+def open_measure_bank(wav_dir, path=DEFAULT_BANK_PATH, cache_size=CACHE_SIZE, sample_rate=None):
+    """Open the shared bank, (re)building it from `wav_dir` if it is missing or stale.
+
+    Pass the output stream's `sample_rate` to get cues prepared for it;
+    they live in their own bank file, bank_path(sample_rate, path).
+    """
+    path = bank_path(sample_rate, path)
+    if os.path.exists(path):
+        try:
+            bank = AudioBank(path, cache_size)
+            if not os.path.isdir(wav_dir) or (
+                    bank.digest == source_digest(list_measure_wavs(wav_dir), sample_rate)
+                    and (sample_rate is None or bank.sample_rate == sample_rate)):
+                return bank
+        except (ValueError, struct.error):
+            pass
+    build_bank(wav_dir, path, sample_rate)
+    return AudioBank(path, cache_size)
+
+# ================= CLI =================
+def main():
+    parser = argparse.ArgumentParser(description="Pack a measure_wavs folder into an audio bank")
+    parser.add_argument("wav_dir")
+    parser.add_argument("--rate", type=int, default=DEVICE_RATE,
+                        help="output rate to prepare the cues for; 0 keeps the files as they are")
+    parser.add_argument("-o", "--output", default=DEFAULT_BANK_PATH,
+                        help="bank path (the rate is added to the name)")
+    args = parser.parse_args()
+    rate = args.rate or None
+    build_bank(args.wav_dir, bank_path(rate, args.output), rate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Phone-as-baton tracking shared by the YOLO conductor scripts.
+
+BeatCounter holds the beat / downbeat logic both scripts used inline:
+relative extrema of the smoothed box centre. DetectThenTrack runs the
+expensive detector only every few frames, or when tracking gets shaky,
+and follows the box with Lucas-Kanade optical flow in between, so the
+baton position updates at camera rate on a CPU. AsyncBatonTracker runs
+all of that on its own thread against a LatestFrameGrabber, so capture
+never waits on inference and every beat carries its frame's capture time.
+"""
+import threading
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# ================= CONFIG =================
+PHONE_CLASS = 67          # COCO "cell phone"
+SMOOTHING = 5             # frames moving average
+MIN_FRAMES_BETWEEN_CLICKS = 5
+DETECT_EVERY = 5          # frames between detector runs while tracking holds
+MIN_TRACK_CONFIDENCE = 0.5  # share of flow points that survive the forward-backward check
+MIN_TRACK_POINTS = 6
+MAX_TRACK_POINTS = 40
+MAX_FB_ERROR = 1.0        # px
+
+
+def largest_box(boxes, classes, cls=PHONE_CLASS):
+    """Largest (x1, y1, x2, y2) box of class `cls`, or None"""
+    picked = [b for i, b in enumerate(boxes) if int(classes[i]) == cls]
+    if not picked:
+        return None
+    return tuple(float(v) for v in max(picked, key=lambda bb: (bb[2]-bb[0])*(bb[3]-bb[1])))
+
+def is_relative_extrema(history, idx):
+    # Simple check: previous < current > next or previous > current < next
+    if len(history) < 3:
+        return False
+    prev, curr, nxt = history[idx-1], history[idx], history[idx+1]
+    return (curr > prev and curr > nxt) or (curr < prev and curr < nxt)
+
+
+# ================= BEATS =================
+class BeatCounter:
+    """Beats at relative extrema of the baton centre; a downbeat is a
+    relative minimum of y (top of the stroke) near the horizontal centre."""
+
+    def __init__(self, frame_width, smoothing=SMOOTHING,
+                 min_frames_between_clicks=MIN_FRAMES_BETWEEN_CLICKS, first_measure=1):
+        self.x_center_range = (frame_width * 0.4, frame_width * 0.6)
+        self.smoothing = smoothing
+        self.x_history = []
+        self.y_history = []
+        self.t_history = []
+        self.measure_number = first_measure
+        self.current_beat = 0
+        self.last_click_frame = -min_frames_between_clicks
+        self.smooth_x = self.smooth_y = None
+
+    def update(self, frame_counter, box, t=None):
+        """Feed the baton box seen on frame `frame_counter`, captured at `t`.
+
+        Returns ("downbeat", measure, t) or ("beat", beat number, t) when
+        the previous frame was an extremum, with that frame's capture time,
+        else None.
+        """
+        x1, y1, x2, y2 = box
+        self.x_history.append((x1 + x2) / 2)
+        self.y_history.append((y1 + y2) / 2)
+        self.t_history.append(t)
+        if len(self.x_history) > self.smoothing:
+            self.x_history.pop(0)
+        if len(self.y_history) > self.smoothing:
+            self.y_history.pop(0)
+        if len(self.t_history) > self.smoothing:
+            self.t_history.pop(0)
+        self.smooth_x = sum(self.x_history) / len(self.x_history)
+        self.smooth_y = sum(self.y_history) / len(self.y_history)
+
+        if frame_counter <= 2 + self.last_click_frame:
+            return None
+        # -2 = middle of the last 3
+        if not (is_relative_extrema(self.y_history, -2) or is_relative_extrema(self.x_history, -2)):
+            return None
+        self.last_click_frame = frame_counter
+        self.current_beat += 1
+        t_extremum = self.t_history[-2]
+        if (self.y_history[-2] == min(self.y_history[-3:])
+                and self.x_center_range[0] < self.smooth_x < self.x_center_range[1]):
+            measure = self.measure_number
+            self.measure_number += 1
+            self.current_beat = 1
+            return ("downbeat", measure, t_extremum)
+        return ("beat", self.current_beat, t_extremum)
+
+
+# ================= DETECT THEN TRACK =================
+class FlowBoxTracker:
+    """Moves a box with the median optical flow of corner features inside it"""
+
+    def __init__(self, max_points=MAX_TRACK_POINTS, max_fb_error=MAX_FB_ERROR):
+        self.max_points = max_points
+        self.max_fb_error = max_fb_error
+        self.prev_gray = None
+        self.points = None
+        self.box = None
+
+    def init(self, gray, box):
+        x1, y1, x2, y2 = (int(round(v)) for v in box)
+        mask = np.zeros_like(gray)
+        mask[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] = 255
+        self.points = cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, 3, mask=mask)
+        self.prev_gray = gray
+        self.box = np.array(box, np.float32)
+
+    def update(self, gray):
+        """(box, confidence) on the new frame; box is None when too few points survive"""
+        if self.points is None or len(self.points) < MIN_TRACK_POINTS:
+            return None, 0.0
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None,
+                                             winSize=(15, 15), maxLevel=2)
+        p0r, st_back, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, p1, None,
+                                                   winSize=(15, 15), maxLevel=2)
+        fb_error = np.abs(self.points - p0r).reshape(-1, 2).max(axis=1)
+        good = (st.ravel() == 1) & (st_back.ravel() == 1) & (fb_error < self.max_fb_error)
+        confidence = float(good.mean())
+        if good.sum() < MIN_TRACK_POINTS:
+            return None, confidence
+
+        old, new = self.points[good].reshape(-1, 2), p1[good].reshape(-1, 2)
+        shift = np.median(new - old, axis=0)
+        # Scale from how the spread of the points around their centre changed
+        old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = old_spread > 1.0
+        scale = float(np.median(new_spread[valid] / old_spread[valid])) if valid.any() else 1.0
+
+        cx, cy = (self.box[:2] + self.box[2:]) / 2 + shift
+        half_w, half_h = (self.box[2:] - self.box[:2]) / 2 * scale
+        self.box = np.array([cx - half_w, cy - half_h, cx + half_w, cy + half_h], np.float32)
+        self.points = new.reshape(-1, 1, 2)
+        self.prev_gray = gray
+        return tuple(float(v) for v in self.box), confidence
+
+
+class DetectThenTrack:
+    """Calls detect(frame) -> box or None every `detect_every` frames, or
+    sooner when the flow tracker loses confidence; tracks in between."""
+
+    def __init__(self, detect, detect_every=DETECT_EVERY, min_confidence=MIN_TRACK_CONFIDENCE):
+        self.detect = detect
+        self.detect_every = detect_every
+        self.min_confidence = min_confidence
+        self.tracker = FlowBoxTracker()
+        self.box = None
+        self.since_detect = 0
+        self.detections = 0
+        self.tracked = 0
+
+    def update(self, frame, gray=None):
+        """Box for this frame, or None; pass `gray` if it is already computed"""
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.box is not None and self.since_detect < self.detect_every:
+            box, confidence = self.tracker.update(gray)
+            if box is not None and confidence >= self.min_confidence:
+                self.box = box
+                self.since_detect += 1
+                self.tracked += 1
+                return box
+
+        self.box = self.detect(frame)
+        self.detections += 1
+        self.since_detect = 1
+        if self.box is not None:
+            self.tracker.init(gray, self.box)
+        return self.box
+
+
+# ================= ASYNC TRACKING =================
+# What the tracking thread made of one frame; event is BeatCounter's
+# (kind, number, t) or None, t the frame's capture time (perf_counter).
+BatonResult = namedtuple("BatonResult", "seq t frame box event")
+
+
+class AsyncBatonTracker:
+    """Runs locate(frame) -> box and a BeatCounter on a thread of its own.
+
+    Each pass takes the newest frame from a LatestFrameGrabber, so when
+    inference is slower than the camera, frames are skipped (and counted)
+    instead of queueing up. Frames are numbered by the grabber, so
+    BeatCounter's frame spacing still reflects real time. on_event(event)
+    is called on the tracking thread.
+    """
+
+    def __init__(self, grabber, locate, beats, on_event=None):
+        self.grabber = grabber
+        self.locate = locate
+        self.beats = beats
+        self.on_event = on_event
+        self.latest = None
+        self.processed = 0
+        self.skipped = 0
+        self.latency_total = 0.0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        if not self.grabber.running:
+            self.grabber.start()
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="baton tracker", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        seq = 0
+        while self.running:
+            item = self.grabber.latest(after=seq, timeout=0.1)
+            if item is None:
+                continue
+            if seq:
+                self.skipped += item[0] - seq - 1
+            seq, t, frame = item
+
+            box = self.locate(frame)
+            event = self.beats.update(seq, box, t) if box is not None else None
+            self.processed += 1
+            self.latency_total += time.perf_counter() - t
+            self.latest = BatonResult(seq, t, frame, box, event)
+            if event is not None and self.on_event is not None:
+                self.on_event(event)
+
+    def mean_latency(self):
+        """Capture-to-result time, averaged over processed frames"""
+        return self.latency_total / self.processed if self.processed else 0.0
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.grabber.release()
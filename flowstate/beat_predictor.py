@@ -0,0 +1,279 @@
+"""Predictive downbeat scheduling.
+
+The reactive detector only hears about a downbeat after the glove has
+been seen inside the bottom region: one camera exposure, the smoothing
+window and an audio block after the conductor actually hit it. Here the
+tempo and phase are estimated from recent downbeats. The click (and
+measure announcement) is then queued on the mixer for the predicted time,
+and moved or cancelled when the glove's trajectory disagrees.
+
+    python -m flowstate.beat_predictor backend/app/measure_times.csv
+
+replays recorded downbeat times and reports how close the predictions land.
+"""
+import argparse
+from collections import deque
+import numpy as np
+
+# ================= CONFIG =================
+HISTORY = 6               # intervals used for the tempo estimate
+MIN_INTERVALS = 3         # before any prediction is trusted
+MAX_JITTER = 0.15         # median abs deviation / period allowed for confidence
+MAX_INTERVAL = 6.0        # longer gaps are pauses: start over
+LOOKAHEAD = 0.4           # schedule this long before the predicted time
+TOLERANCE = 0.12          # fraction of a period a detection may miss the prediction by
+MAX_TOLERANCE = 0.25      # seconds
+DETECTION_LATENCY = 0.12  # detected crossing time minus the real one (smoothing + capture)
+MAX_MISSES = 2            # consecutive unconfirmed predictions before giving up
+
+
+class DownbeatPredictor:
+    """Online tempo and phase estimate from inter-downbeat intervals"""
+
+    def __init__(self, history=HISTORY, min_intervals=MIN_INTERVALS,
+                 max_jitter=MAX_JITTER, max_interval=MAX_INTERVAL):
+        self.times = deque(maxlen=history + 1)
+        self.min_intervals = min_intervals
+        self.max_jitter = max_jitter
+        self.max_interval = max_interval
+
+    def reset(self):
+        self.times.clear()
+
+    def observe(self, t):
+        if self.times and t - self.times[-1] > self.max_interval:
+            self.times.clear()  # long pause, the old tempo means nothing now
+        self.times.append(t)
+
+    def period(self):
+        if len(self.times) < 2:
+            return None
+        return float(np.median(np.diff(self.times)))
+
+    def jitter(self):
+        """Median absolute deviation of the intervals, relative to the period"""
+        if len(self.times) < 3:
+            return None
+        intervals = np.diff(self.times)
+        period = np.median(intervals)
+        return float(np.median(np.abs(intervals - period)) / period)
+
+    def confident(self):
+        return (len(self.times) > self.min_intervals
+                and self.jitter() is not None and self.jitter() <= self.max_jitter)
+
+    def next_downbeat(self, now):
+        """Predicted time of the next downbeat after `now`, or None"""
+        if not self.confident():
+            return None
+        period = self.period()
+        t = self.times[-1] + period
+        if t < now:
+            # Skip over beats that have passed (e.g. one missed detection)
+            t += np.ceil((now - t) / period) * period
+        if t - self.times[-1] > self.max_interval:
+            return None
+        return float(t)
+
+
+class PendingBeat:
+    def __init__(self, time, measure, voice_ids):
+        self.time = time
+        self.measure = measure
+        self.voice_ids = voice_ids
+
+
+class PredictiveScheduler:
+    """Queues the next downbeat's sounds on the mixer ahead of time.
+
+    Call update() every frame and on_detected() when the reactive detector
+    fires. All times are time.perf_counter() seconds. Add
+    unconfirmed_measures to the detector's measure count.
+    """
+
+    def __init__(self, mixer, predictor=None, lookahead=LOOKAHEAD, tolerance=TOLERANCE,
+                 detection_latency=DETECTION_LATENCY, max_misses=MAX_MISSES):
+        self.mixer = mixer
+        self.predictor = predictor or DownbeatPredictor()
+        self.lookahead = lookahead
+        self.tolerance = tolerance
+        self.detection_latency = detection_latency
+        self.max_misses = max_misses
+        self.pending = None
+        self.expired = None      # a missed prediction a late detection may still match
+        self.cancelled_t = None  # time of a cancelled prediction, not to be queued again
+        self.misses = 0
+        # Predicted downbeats that sounded (announcement and all) without a
+        # detection; the caller adds these to its measure count
+        self.unconfirmed_measures = 0
+        self.stats = {"scheduled": 0, "confirmed": 0, "late": 0, "corrected": 0, "cancelled": 0,
+                      "missed": 0, "reactive": 0}
+
+    def _window(self):
+        period = self.predictor.period() or 1.0
+        return min(self.tolerance * period, MAX_TOLERANCE)
+
+    def _cancel(self):
+        for voice_id in self.pending.voice_ids:
+            self.mixer.cancel(voice_id)
+        self.pending = None
+
+    def _schedule(self, t, measure, sounds, trace_id=None):
+        ids = [self.mixer.play(s, at=t, trace_id=trace_id) for s in sounds]
+        self.pending = PendingBeat(t, measure, ids)
+
+    def update(self, now, sounds_for, next_measure, y=None, vy=None, boundary=None, trace_id=None):
+        """Schedule, move or cancel the upcoming downbeat.
+
+        sounds_for(measure) returns the sounds to play on that downbeat.
+        y / vy / boundary (pixels, pixels per second, downwards positive)
+        describe the glove so predictions can be checked against it.
+        Returns a short event name when something changed, else None.
+        """
+        window = self._window()
+        if self.expired is not None and now > self.expired.time + 2 * window + self.detection_latency:
+            self.expired = None
+        if self.cancelled_t is not None and now > self.cancelled_t + window:
+            self.cancelled_t = None
+
+        if self.pending is not None:
+            # Nothing confirmed it: the click already sounded
+            if now > self.pending.time + window + self.detection_latency:
+                self.expired, self.pending = self.pending, None
+                self.unconfirmed_measures += 1  # its measure was announced, so it counts
+                self.misses += 1
+                self.stats["missed"] += 1
+                if self.misses >= self.max_misses:
+                    self.predictor.reset()
+                    self.misses = 0
+                return "missed"
+
+            time_left = self.pending.time - now
+            if y is not None and boundary is not None and 0 < time_left < self.lookahead:
+                if y < boundary:
+                    eta = (boundary - y) / vy if vy and vy > 0 else None
+                    if eta is None and time_left < window:
+                        # Glove is above the line and not coming down
+                        self.cancelled_t = self.pending.time
+                        self._cancel()
+                        self.stats["cancelled"] += 1
+                        return "cancelled"
+                    if eta is not None and abs(now + eta - self.pending.time) > window:
+                        # Coming down, but not when we expected: move the click
+                        measure = self.pending.measure
+                        self._cancel()
+                        self._schedule(now + eta, measure, sounds_for(measure), trace_id)
+                        self.stats["corrected"] += 1
+                        return "corrected"
+            return None
+
+        t = self.predictor.next_downbeat(now)
+        if t is not None and self.cancelled_t is not None and abs(t - self.cancelled_t) <= window:
+            return None  # the same prediction again; it stays cancelled
+        if t is not None and t - now <= self.lookahead:
+            self._schedule(t, next_measure, sounds_for(next_measure), trace_id)
+            self.stats["scheduled"] += 1
+            return "scheduled"
+        return None
+
+    def on_detected(self, t_detected):
+        """Reactive detection at `t_detected`. True if the scheduled click covered it."""
+        t = t_detected - self.detection_latency
+        covered = False
+        self.cancelled_t = None
+        if self.pending is None and self.expired is not None:
+            window = self._window()
+            if self.expired.time - window <= t <= self.expired.time + 2 * window:
+                # A slow downbeat just after its prediction expired: it already
+                # sounded and was counted, and the detector counts it too
+                covered = True
+                self.unconfirmed_measures -= 1
+                self.stats["late"] += 1
+            self.expired = None
+        elif self.pending is not None:
+            window = self._window()
+            if abs(t - self.pending.time) <= window:
+                covered = True
+                self.stats["confirmed"] += 1
+                self.pending = None
+            elif t > self.pending.time + window:
+                # Late: the click has already sounded, keep it rather than
+                # playing it twice; observing t below corrects the timing
+                covered = True
+                self.stats["late"] += 1
+                self.pending = None
+            else:
+                # Early: the scheduled click would land late, play reactively instead
+                self._cancel()
+                self.stats["cancelled"] += 1
+        if not covered:
+            self.stats["reactive"] += 1
+        self.misses = 0
+        self.predictor.observe(t)
+        return covered
+
+# ================= OFFLINE CHECK =================
+def replay(times, lookahead=LOOKAHEAD):
+    """Prediction error for each downbeat in a recorded sequence"""
+    predictor = DownbeatPredictor()
+    errors = []
+    for t in times:
+        predicted = predictor.next_downbeat(t - lookahead)
+        if predicted is not None:
+            errors.append(t - predicted)
+        predictor.observe(t)
+    return np.array(errors)
+
+class _RecordingMixer:
+    """Stands in for the Mixer: notes what was queued and cancelled"""
+
+    def __init__(self):
+        self.queued = {}
+        self.cancelled = set()
+
+    def play(self, sound, at=None, trace_id=None):
+        voice_id = len(self.queued)
+        self.queued[voice_id] = at
+        return voice_id
+
+    def cancel(self, voice_id):
+        self.cancelled.add(voice_id)
+
+    def sounded(self):
+        """Times of the queued sounds that were not cancelled"""
+        return sorted(at for voice_id, at in self.queued.items() if voice_id not in self.cancelled)
+
+def replay_held_glove(times, fps=30.0):
+    """Replay downbeats, then hold the glove above the line for two more
+    periods: returns the scheduler stats and any clicks that still sounded"""
+    mixer = _RecordingMixer()
+    scheduler = PredictiveScheduler(mixer, detection_latency=0.0)
+    pending = list(times)
+    t, end = pending[0], times[-1] + 2 * (times[-1] - times[-2])
+    while t < end:
+        while pending and t >= pending[0]:
+            scheduler.on_detected(pending.pop(0))
+        y = 500.0 if pending else 100.0  # glove below the line (400) until the last downbeat
+        scheduler.update(t, lambda measure: [None], 0, y=y, vy=0.0, boundary=400.0)
+        t += 1 / fps
+    return scheduler.stats, [at for at in mixer.sounded() if at > times[-1] + 0.05]
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded downbeat times through the predictor")
+    parser.add_argument("csv", help="one downbeat time (seconds) per line, e.g. measure_times.csv")
+    parser.add_argument("--held", action="store_true",
+                        help="then hold the glove above the line and check no predicted click sounds")
+    args = parser.parse_args()
+    times = np.atleast_1d(np.loadtxt(args.csv))
+    if args.held:
+        stats, stray = replay_held_glove(times)
+        print(f"held glove: {stats['scheduled']} scheduled, {stats['cancelled']} cancelled, "
+              f"{len(stray)} clicks sounded after the last downbeat")
+    errors = replay(times)
+    print(f"{len(times)} downbeats, {len(errors)} predicted")
+    if len(errors):
+        print(f"error: median {np.median(np.abs(errors)) * 1e3:.0f} ms, "
+              f"max {np.max(np.abs(errors)) * 1e3:.0f} ms, mean {np.mean(errors) * 1e3:+.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Benchmark: detect-then-track against running the detector on every frame.
+
+    python -m flowstate.bench_baton --video phone.mp4              # YOLO phone detector
+    python -m flowstate.bench_baton --detector red                 # synthetic red glove, no YOLO needed
+
+Both modes feed the same BeatCounter. The per-frame detector's beats are
+the reference; detect-then-track is scored on how many of them it
+reproduces (within --slack frames) and on how far its box centre drifts.
+"""
+import argparse
+import time
+import numpy as np
+
+from flowstate.baton import DETECT_EVERY, PHONE_CLASS, BeatCounter, DetectThenTrack, largest_box
+from flowstate.bench_segmentation import synthetic_frames, video_frames
+from flowstate.segmentation import RedSegmenter
+
+# ================= DETECTORS =================
+def yolo_detector(weights="yolov8n.pt"):
+    from flowstate.inference import load_backend
+    model = load_backend(weights, classes=[PHONE_CLASS])
+    model.warmup()
+
+    def detect(frame):
+        boxes, _, classes = model(frame)
+        return largest_box(boxes, classes, PHONE_CLASS)
+    return detect
+
+def red_detector():
+    segmenter = RedSegmenter()
+
+    def detect(frame):
+        blob = segmenter.largest_blob(frame)
+        if blob is None:
+            return None
+        x, y, w, h = blob.bbox
+        return (float(x), float(y), float(x + w), float(y + h))
+    return detect
+
+# ================= BENCH =================
+def run(frames, locate):
+    counter = BeatCounter(frames[0].shape[1])
+    events, centres = [], []
+    start = time.perf_counter()
+    for frame_counter, frame in enumerate(frames, 1):
+        box = locate(frame)
+        centres.append(None if box is None else ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+        if box is not None:
+            event = counter.update(frame_counter, box)
+            if event is not None:
+                events.append((frame_counter, event[0]))
+    fps = len(frames) / (time.perf_counter() - start)
+    return events, centres, fps
+
+def match_events(reference, candidate, slack):
+    """Reference events reproduced by a candidate event of the same kind within `slack` frames"""
+    used = set()
+    matched = 0
+    for frame, kind in reference:
+        for i, (c_frame, c_kind) in enumerate(candidate):
+            if i not in used and c_kind == kind and abs(c_frame - frame) <= slack:
+                used.add(i)
+                matched += 1
+                break
+    return matched
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", help="recording to use instead of synthetic frames")
+    parser.add_argument("--detector", choices=["yolo", "red"], default="yolo")
+    parser.add_argument("--weights", default="yolov8n.pt", help=".pt, .onnx or *_openvino_model/")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--detect-every", type=int, default=DETECT_EVERY)
+    parser.add_argument("--slack", type=int, default=2, help="frames a beat may move and still count")
+    args = parser.parse_args()
+
+    frames = video_frames(args.video, args.frames) if args.video else synthetic_frames(args.frames)
+    detect = yolo_detector(args.weights) if args.detector == "yolo" else red_detector()
+    detect(frames[0])  # warmup
+
+    ref_events, ref_centres, ref_fps = run(frames, detect)
+    tracker = DetectThenTrack(detect, detect_every=args.detect_every)
+    events, centres, fps = run(frames, tracker.update)
+
+    drift = [np.hypot(a[0] - b[0], a[1] - b[1]) for a, b in zip(ref_centres, centres)
+             if a is not None and b is not None]
+    matched = match_events(ref_events, events, args.slack)
+    print(f"every frame     : {ref_fps:7.1f} fps, {len(ref_events)} beats")
+    print(f"detect-then-track: {fps:7.1f} fps, {len(events)} beats, "
+          f"detector on {tracker.detections}/{len(frames)} frames")
+    print(f"beats reproduced: {matched}/{len(ref_events)}  extra: {len(events) - matched}  "
+          f"centre drift: mean {np.mean(drift):.1f} px, max {np.max(drift):.1f} px")
+
+if __name__ == "__main__":
+    main()
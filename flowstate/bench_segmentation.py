@@ -0,0 +1,108 @@
+"""Micro-benchmark: per-frame cost of the red-glove segmentation paths.
+
+    python -m flowstate.bench_segmentation                 # synthetic frames
+    python -m flowstate.bench_segmentation --video clip.mp4
+
+"before" is the original cvtColor / inRange / blur / findContours / hull
+chain, "after" is the lookup-table RedSegmenter, "tracked" adds RoiTracker.
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+
+from flowstate.segmentation import RED_RANGES, MIN_BLOB_AREA, RedSegmenter, RoiTracker, compile_lut
+
+# ================= BASELINE =================
+def legacy_bottommost(frame):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    lower_red1 = np.array([0,120,70])
+    upper_red1 = np.array([10,255,255])
+    lower_red2 = np.array([170,120,70])
+    upper_red2 = np.array([180,255,255])
+    mask = cv2.inRange(hsv, lower_red1, upper_red1) | cv2.inRange(hsv, lower_red2, upper_red2)
+    mask = cv2.GaussianBlur(mask, (5,5), 0)
+
+    contours,_ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        cnt = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(cnt) > MIN_BLOB_AREA:
+            hull = cv2.convexHull(cnt)
+            return tuple(int(v) for v in hull[hull[:,:,1].argmax()][0])
+    return None
+
+# ================= FRAMES =================
+def synthetic_frames(n, width=640, height=480, seed=0):
+    """Textured background with a red glove on a conducting-like path"""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (31, 31), 0)
+    frames = []
+    for i in range(n):
+        frame = background.copy()
+        x = int(width / 2 + width / 5 * np.cos(i / 13))
+        y = int(height / 2 + height / 3 * np.sin(i / 7))
+        cv2.ellipse(frame, (x, y), (35, 45), 0, 0, 360, (30, 20, 200), -1)
+        frames.append(frame)
+    return frames
+
+def video_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+# ================= BENCH =================
+def time_path(name, fn, frames, repeat):
+    points = [fn(f) for f in frames]  # warmup, also used for comparison
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for f in frames:
+            fn(f)
+    per_frame = (time.perf_counter() - start) / (repeat * len(frames))
+    print(f"{name:>8}: {per_frame * 1e3:7.3f} ms/frame  ({1 / per_frame:7.0f} fps)")
+    return points
+
+def max_error(a, b):
+    errors = [abs(p[1] - q[1]) for p, q in zip(a, b) if p is not None and q is not None]
+    misses = sum((p is None) != (q is None) for p, q in zip(a, b))
+    return (max(errors) if errors else 0), misses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", help="benchmark on frames from this file instead")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    frames = video_frames(args.video, args.frames) if args.video else synthetic_frames(args.frames)
+    if not frames:
+        raise SystemExit("No frames to benchmark")
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {w}x{h}, {args.repeat} passes")
+
+    start = time.perf_counter()
+    compile_lut(RED_RANGES)
+    print(f"lookup table built in {(time.perf_counter() - start) * 1e3:.0f} ms (one-time)")
+
+    segmenter = RedSegmenter()
+    before = time_path("before", legacy_bottommost, frames, args.repeat)
+    after = time_path("after", segmenter.bottommost, frames, args.repeat)
+
+    # The tracker is stateful: replay the sequence in order each pass
+    tracker = RoiTracker(segmenter=segmenter)
+    def tracked(frame):
+        return tracker.locate(frame)
+    tracked_points = time_path("tracked", tracked, frames, args.repeat)
+
+    for name, points in (("after", after), ("tracked", tracked_points)):
+        err, misses = max_error(before, points)
+        print(f"{name} vs before: max |dy| {err}px, {misses} detection mismatches")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import asyncio
+import time
+from collections import deque
+
+from flowstate.queues import LoopHandoff
+from flowstate.tracing import NULL_TRACER
+
+# ================= CONFIG =================
+MAX_PENDING_EVENTS = 256   # undelivered beat/status events before a client is dropped
+MAX_CLIENT_LAG = 5.0       # seconds a client may sit on undelivered data
+
+
+class ClientChannel:
+    """One subscriber: its own event queue, latest-frame slot and sender task"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.events = deque()       # (enqueue time, message, trace id)
+        self.latest_frame = None     # (message, trace id)
+        self.frame_pending_since = None
+        self.wake = asyncio.Event()
+        self.task = None
+        self.frames_sent = 0
+        self.frames_coalesced = 0
+        self.events_sent = 0
+
+    def lag(self, now=None):
+        """Age of the oldest item this client has not been sent yet"""
+        oldest = self.frame_pending_since
+        if self.events and (oldest is None or self.events[0][0] < oldest):
+            oldest = self.events[0][0]
+        if oldest is None:
+            return 0.0
+        return (now or time.monotonic()) - oldest
+
+
+class Broadcaster:
+    """Fan-out to WebSocket clients that never lets one client hold up the rest.
+
+    Every client gets its own sender task. Events (beats, downbeats, status)
+    are queued and delivered in order; preview frames are latest-wins, so a
+    slow client simply skips frames. Clients whose backlog or lag grows past
+    the limits are disconnected.
+
+    publish_*() must be called on the event loop; the *_threadsafe variants
+    may be called from any thread and go through a LoopHandoff, so they
+    never flood the loop with wake-up callbacks however fast they are called.
+    """
+
+    def __init__(self, max_pending_events=MAX_PENDING_EVENTS, max_lag=MAX_CLIENT_LAG,
+                 tracer=NULL_TRACER):
+        self.tracer = tracer
+        self.max_pending_events = max_pending_events
+        self.max_lag = max_lag
+        self.channels = {}
+        self.loop = None
+        self.dropped_clients = 0
+
+        # Hand-off from producer threads; only the newest frame is kept
+        self._thread_events = LoopHandoff(self._publish_events)
+        self._thread_frames = LoopHandoff(self._publish_frames, maxsize=1)
+
+    # ---------------- CLIENTS ----------------
+    def add(self, ws):
+        """Register an accepted WebSocket and start its sender task"""
+        self.loop = asyncio.get_running_loop()
+        self._thread_events.bind(self.loop)
+        self._thread_frames.bind(self.loop)
+        ch = ClientChannel(ws)
+        ch.task = asyncio.create_task(self._sender(ch))
+        self.channels[ws] = ch
+        return ch
+
+    def remove(self, ws):
+        ch = self.channels.pop(ws, None)
+        if ch is not None and ch.task is not None and ch.task is not asyncio.current_task():
+            ch.task.cancel()
+
+    def __len__(self):
+        return len(self.channels)
+
+    def stats(self):
+        now = time.monotonic()
+        return [{
+            "lag": round(ch.lag(now), 3),
+            "pending_events": len(ch.events),
+            "frames_sent": ch.frames_sent,
+            "frames_coalesced": ch.frames_coalesced,
+            "events_sent": ch.events_sent,
+        } for ch in self.channels.values()]
+
+    # ---------------- PUBLISH (event loop) ----------------
+    def publish_event(self, message, trace_id=None):
+        """Queue a must-deliver message (dict -> JSON, str -> text, bytes -> binary)"""
+        now = time.monotonic()
+        for ch in list(self.channels.values()):
+            ch.events.append((now, message, trace_id))
+            self._check_and_wake(ch, now)
+
+    def send_to(self, ws, message):
+        """Queue a must-deliver message for a single client"""
+        ch = self.channels.get(ws)
+        if ch is not None:
+            now = time.monotonic()
+            ch.events.append((now, message, None))
+            self._check_and_wake(ch, now)
+
+    def publish_frame(self, payload, trace_id=None):
+        """Offer a preview frame; replaces any frame the client has not sent yet"""
+        now = time.monotonic()
+        for ch in list(self.channels.values()):
+            if ch.latest_frame is not None:
+                ch.frames_coalesced += 1
+            else:
+                ch.frame_pending_since = now
+            ch.latest_frame = (payload, trace_id)
+            self._check_and_wake(ch, now)
+
+    def _check_and_wake(self, ch, now):
+        if len(ch.events) > self.max_pending_events or ch.lag(now) > self.max_lag:
+            print(f"Dropping lagging client (lag {ch.lag(now):.1f}s, {len(ch.events)} events pending)")
+            self.dropped_clients += 1
+            self.remove(ch.ws)
+            asyncio.ensure_future(self._close(ch.ws))
+            return
+        ch.wake.set()
+
+    # ---------------- PUBLISH (any thread) ----------------
+    def publish_event_threadsafe(self, message, trace_id=None):
+        self._thread_events.put((message, trace_id))
+
+    def publish_frame_threadsafe(self, payload, trace_id=None):
+        self._thread_frames.put((payload, trace_id))
+
+    def _publish_events(self, events):
+        for message, trace_id in events:
+            self.publish_event(message, trace_id)
+
+    def _publish_frames(self, frames):
+        for payload, trace_id in frames:
+            self.publish_frame(payload, trace_id)
+
+    # ---------------- SENDING ----------------
+    @staticmethod
+    async def _send(ws, message):
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            await ws.send_bytes(bytes(message))
+        elif isinstance(message, str):
+            await ws.send_text(message)
+        else:
+            await ws.send_json(message)
+
+    @staticmethod
+    async def _close(ws):
+        try:
+            await asyncio.wait_for(ws.close(), timeout=1.0)
+        except Exception:
+            pass
+
+    async def _sender(self, ch):
+        try:
+            while True:
+                await ch.wake.wait()
+                ch.wake.clear()
+                # Events first and in order, then only the newest frame
+                while ch.events:
+                    _, message, trace_id = ch.events[0]
+                    start = time.perf_counter()
+                    await self._send(ch.ws, message)
+                    ch.events.popleft()
+                    ch.events_sent += 1
+                    if trace_id is not None:
+                        self.tracer.complete("ws send event", start, time.perf_counter(),
+                                             trace_id, cat="network")
+                frame, ch.latest_frame = ch.latest_frame, None
+                ch.frame_pending_since = None
+                if frame is not None:
+                    payload, trace_id = frame
+                    start = time.perf_counter()
+                    await self._send(ch.ws, payload)
+                    ch.frames_sent += 1
+                    if trace_id is not None:
+                        self.tracer.complete("ws send frame", start, time.perf_counter(),
+                                             trace_id, cat="network")
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Client went away mid-send
+            self.remove(ch.ws)
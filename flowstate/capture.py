@@ -0,0 +1,167 @@
+"""Low-latency camera capture.
+
+cap.read() hands back the oldest frame the driver has buffered, which
+with the default 4+ buffers is 100-200 ms stale before detection even
+starts. open_capture() picks the platform's native backend first (V4L2
+on Linux), asks for a single driver buffer and a compressed or raw pixel
+format. LatestFrameGrabber then reads continuously on its own thread and
+only ever exposes the newest frame, with the time it was captured.
+
+Both work with anything VideoCapture-like, including a video file.
+"""
+import sys
+import threading
+import time
+import cv2
+
+from flowstate.frame_sources import FrameSource
+
+# ================= CONFIG =================
+if sys.platform.startswith("linux"):
+    CAPTURE_BACKENDS = [cv2.CAP_V4L2, cv2.CAP_ANY]
+elif sys.platform == "darwin":
+    CAPTURE_BACKENDS = [cv2.CAP_AVFOUNDATION, cv2.CAP_ANY]
+else:
+    CAPTURE_BACKENDS = [cv2.CAP_DSHOW, cv2.CAP_MSMF, cv2.CAP_ANY]
+PIXEL_FORMATS = ("MJPG", "YUYV")  # MJPEG fits 30 fps at 640x480 over USB 2; YUYV skips the decode
+BUFFER_SIZE = 1
+MAX_TIMESTAMP_AGE = 1.0  # driver timestamps further from now than this are ignored
+
+
+def fourcc_name(value):
+    value = int(value)
+    return "".join(chr((value >> 8 * i) & 0xFF) for i in range(4))
+
+def open_capture(index=0, width=None, height=None, fps=None, formats=PIXEL_FORMATS,
+                 buffer_size=BUFFER_SIZE, backends=CAPTURE_BACKENDS):
+    """Open camera `index` on the first backend that works, configured for low latency"""
+    for backend in backends:
+        cap = cv2.VideoCapture(index, backend)
+        if not cap.isOpened():
+            cap.release()
+            continue
+        # The pixel format has to be chosen before the size on V4L2
+        for fmt in formats:
+            if cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fmt)) \
+                    and fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)) == fmt:
+                break
+        if width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            cap.set(cv2.CAP_PROP_FPS, fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        print(f"Camera {index} opened using backend {cap.getBackendName()}: "
+              f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+              f"{fourcc_name(cap.get(cv2.CAP_PROP_FOURCC))} @ {cap.get(cv2.CAP_PROP_FPS):.0f} fps")
+        return cap
+    return None
+
+
+class LatestFrameGrabber:
+    """Reads a capture on a background thread and keeps only the newest frame.
+
+    Each frame is stamped with time.perf_counter() seconds: the driver's
+    own capture timestamp where it has one on the same clock (V4L2 buffer
+    timestamps are CLOCK_MONOTONIC, as is perf_counter on Linux), otherwise
+    the time the read returned. For a file, pace_fps makes the reads run
+    at a camera-like rate.
+    """
+
+    def __init__(self, cap, pace_fps=None, retry_delay=0.01):
+        self.cap = cap
+        self.pace_fps = pace_fps
+        self.retry_delay = retry_delay
+        self.seq = 0
+        self.frame = None
+        self.timestamp = None
+        self.grabbed = 0
+        self.failed_reads = 0
+        self.running = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="frame grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def _timestamp(self, read_end):
+        driver_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if self.cap.getBackendName() == "V4L2" and driver_ms > 0:
+            t = driver_ms / 1000.0
+            if 0 <= read_end - t < MAX_TIMESTAMP_AGE:
+                return t
+        return read_end
+
+    def _run(self):
+        next_read = time.perf_counter()
+        while self.running:
+            if self.pace_fps:
+                delay = next_read - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_read += 1 / self.pace_fps
+            ret, frame = self.cap.read()
+            if not ret:
+                self.failed_reads += 1
+                time.sleep(self.retry_delay)
+                continue
+            t = self._timestamp(time.perf_counter())
+            with self._cond:
+                self.seq += 1
+                self.grabbed += 1
+                self.frame, self.timestamp = frame, t
+                self._cond.notify_all()
+
+    def latest(self, after=0, timeout=None):
+        """(seq, timestamp, frame) of the newest frame newer than seq `after`, or None on timeout"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq > after or not self.running, timeout):
+                return None
+            if self.seq <= after:
+                return None
+            return self.seq, self.timestamp, self.frame
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    def release(self):
+        self.stop()
+        self.cap.release()
+
+
+class GrabberSource(FrameSource):
+    """Frame source over a LatestFrameGrabber; frames that went by unread are skipped"""
+    perf_clock = True
+
+    def __init__(self, grabber, timeout=0.1):
+        super().__init__(realtime=False)
+        self.grabber = grabber
+        self.timeout = timeout
+        self.fps = grabber.cap.get(cv2.CAP_PROP_FPS) or None
+        self.skipped = 0
+
+    def _frames(self):
+        if not self.grabber.running:
+            self.grabber.start()
+        seq = 0
+        while self.running:
+            item = self.grabber.latest(after=seq, timeout=self.timeout)
+            if item is None:
+                continue
+            if seq:
+                self.skipped += item[0] - seq - 1
+            seq, t, frame = item
+            yield t, frame
+
+    def close(self):
+        self.stop()
+        self.grabber.release()
@@ -0,0 +1,65 @@
+"""NTP-style clock offset and round-trip estimation for one WebSocket client.
+
+Each exchange is a ping stamped with the server clock (t0), answered by
+the client with its own clock reading (t1) and received back at t3:
+
+    rtt    = t3 - t0
+    offset = t1 - (t0 + t3) / 2        (client clock minus server clock)
+
+which assumes the two directions take equally long. Queueing on a busy
+network only ever adds delay, so of the last few exchanges the one with
+the smallest round trip gives the best offset (NTP's clock filter).
+"""
+from collections import deque
+import numpy as np
+
+# ================= CONFIG =================
+SYNC_WINDOW = 16          # exchanges the filter looks back over
+SYNC_BURST = 5            # quick pings right after connecting
+SYNC_BURST_INTERVAL = 0.1
+SYNC_INTERVAL = 1.0
+
+
+class ClockSync:
+    def __init__(self, window=SYNC_WINDOW):
+        self.samples = deque(maxlen=window)  # (rtt, offset)
+        self.exchanges = 0
+
+    def add(self, t0, t1, t3):
+        """Record one ping: sent at server t0, answered at client t1, back at server t3"""
+        rtt = t3 - t0
+        if rtt < 0:
+            return
+        self.samples.append((rtt, t1 - (t0 + t3) / 2))
+        self.exchanges += 1
+
+    @property
+    def synced(self):
+        return bool(self.samples)
+
+    @property
+    def rtt(self):
+        """Round trip of the best recent exchange, in seconds"""
+        return min(self.samples)[0] if self.samples else None
+
+    @property
+    def offset(self):
+        """Client clock minus server clock, from the best recent exchange"""
+        return min(self.samples)[1] if self.samples else None
+
+    @property
+    def jitter(self):
+        """Spread of recent round trips (s); the best-case rtt hides it"""
+        if len(self.samples) < 2:
+            return None
+        return float(np.std([rtt for rtt, _ in self.samples]))
+
+    def to_server(self, t_client):
+        return t_client - self.offset
+
+    def to_client(self, t_server):
+        return t_server + self.offset
+
+    def stats(self):
+        return {"exchanges": self.exchanges,
+                "offset": self.offset, "rtt": self.rtt, "jitter": self.jitter}
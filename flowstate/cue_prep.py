@@ -0,0 +1,121 @@
+"""One-time preparation of spoken cues for the output device.
+
+wavfile.read hands back samples at whatever rate, width and channel count
+the file was written with. prepare_cue() turns that into what the mixer
+plays: float mono at the device rate (polyphase resampling), with leading
+and trailing silence cut and the spoken part brought to a common loudness.
+
+CueCache stores the prepared int16 result on disk under the hash of the
+source file's bytes and the target rate, so each cue is only ever
+prepared once per rate, whichever folder or bank it ends up in.
+"""
+import hashlib
+import os
+from math import gcd
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+# ================= CONFIG =================
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, ".cue_cache")
+PREP_VERSION = 1            # bump when the processing below changes; old cache entries are ignored
+TARGET_LOUDNESS_DB = -20.0  # RMS of the spoken part, dBFS
+PEAK_CEILING_DB = -1.0      # the gain never pushes a peak above this
+SILENCE_DB = -40.0          # frames this far below the loudest one count as silence
+FRAME_MS = 10
+TRIM_PAD_MS = 15
+
+
+def to_float_mono(data):
+    """Any wavfile.read sample format -> float32 in [-1, 1], channels averaged"""
+    if data.dtype.kind == "f":
+        data = data.astype(np.float32)
+    elif data.dtype == np.uint8:
+        data = (data.astype(np.float32) - 128.0) / 128.0
+    else:
+        data = data.astype(np.float32) / float(2 ** (data.dtype.itemsize * 8 - 1))
+    if data.ndim > 1:
+        data = data.mean(axis=1, dtype=np.float32)
+    return data
+
+def resample(data, fs_in, fs_out):
+    if fs_in == fs_out:
+        return data
+    g = gcd(int(fs_in), int(fs_out))
+    return resample_poly(data, fs_out // g, fs_in // g).astype(np.float32)
+
+def frame_rms(data, fs, frame_ms=FRAME_MS):
+    frame = max(1, int(fs * frame_ms / 1000))
+    n = len(data) // frame
+    if n == 0:
+        return np.sqrt(np.mean(np.square(data), keepdims=True)), frame
+    frames = data[:n * frame].reshape(n, frame)
+    return np.sqrt(np.mean(np.square(frames), axis=1)), frame
+
+def trim_silence(data, fs, silence_db=SILENCE_DB, pad_ms=TRIM_PAD_MS):
+    rms, frame = frame_rms(data, fs)
+    loud = np.flatnonzero(rms > rms.max() * 10 ** (silence_db / 20))
+    if rms.max() <= 0 or not len(loud):
+        return data
+    pad = int(fs * pad_ms / 1000)
+    start = max(0, loud[0] * frame - pad)
+    end = min(len(data), (loud[-1] + 1) * frame + pad)
+    return data[start:end]
+
+def normalize_loudness(data, fs, target_db=TARGET_LOUDNESS_DB, ceiling_db=PEAK_CEILING_DB,
+                       silence_db=SILENCE_DB):
+    """Scale so the non-silent frames have RMS target_db, without peaks over ceiling_db"""
+    rms, _ = frame_rms(data, fs)
+    if rms.max() <= 0:
+        return data
+    voiced = rms[rms > rms.max() * 10 ** (silence_db / 20)]
+    loudness = np.sqrt(np.mean(np.square(voiced)))
+    gain = 10 ** (target_db / 20) / loudness
+    peak = np.abs(data).max()
+    gain = min(gain, 10 ** (ceiling_db / 20) / peak)
+    return (data * gain).astype(np.float32)
+
+def prepare_cue(data, fs_in, fs_out):
+    """Raw wavfile.read samples at fs_in -> float32 mono cue at fs_out"""
+    cue = resample(to_float_mono(data), fs_in, fs_out)
+    cue = trim_silence(cue, fs_out)
+    return normalize_loudness(cue, fs_out)
+
+def to_int16(cue):
+    return (np.clip(cue, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class CueCache:
+    """Prepared int16 cues on disk, keyed by source content hash and rate"""
+
+    def __init__(self, sample_rate, directory=DEFAULT_CACHE_DIR):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}_{self.sample_rate}_v{PREP_VERSION}.npy")
+
+    def load(self, wav_path):
+        """Prepared int16 mono cue for a WAV file, from the cache when possible"""
+        with open(wav_path, "rb") as f:
+            raw = f.read()
+        path = self._path(hashlib.blake2b(raw, digest_size=16).hexdigest())
+        if os.path.exists(path):
+            try:
+                cue = np.load(path)
+                self.hits += 1
+                return cue
+            except (OSError, ValueError):
+                pass  # torn or foreign file: prepare it again
+        fs_in, data = wavfile.read(wav_path)
+        cue = to_int16(prepare_cue(data, fs_in, self.sample_rate))
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, cue)
+        os.replace(tmp_path, path)
+        self.misses += 1
+        return cue
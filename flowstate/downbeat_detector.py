@@ -0,0 +1,117 @@
+"""Bottom-region downbeat detection, independent of camera, clock and audio.
+
+The glove's lowest point is tracked with a constant-acceleration Kalman
+filter (or, with kinematic=False, the old moving average over a few
+frames); a downbeat is the tracked point moving down into the bottom
+region of the frame. The downbeat is stamped with the moment the filtered
+trajectory crossed the boundary, between frames, rather than the time of
+the frame that first saw it. All timing comes from the frame timestamps
+passed in, so a recording replayed at any speed gives the same decisions
+as it did live.
+"""
+from collections import deque, namedtuple
+import time
+
+from flowstate.kinematics import KinematicTracker
+from flowstate.segmentation import RoiTracker, find_red_bottommost
+from flowstate.tracing import NULL_TRACER
+
+# ================= CONFIG =================
+BOTTOM_REGION_HEIGHT = 250
+MIN_TIME_BETWEEN_CLICKS = 0.3
+SMOOTHING_FRAMES = 5
+
+# What process() decided about one frame. smoothed_y / vy are None until
+# there are two glove positions; vy is in pixels per second, downwards positive.
+# downbeat_t is the interpolated boundary crossing time when downbeat is set.
+Decision = namedtuple("Decision", "frame_id t downbeat measure_count point smoothed_y vy downbeat_t")
+
+_SEGMENT = object()  # process() default: find the glove ourselves
+
+
+class DownbeatDetector:
+    def __init__(self, bottom_region_height=BOTTOM_REGION_HEIGHT,
+                 min_time_between_clicks=MIN_TIME_BETWEEN_CLICKS,
+                 smoothing_frames=SMOOTHING_FRAMES, roi_tracking=True, kinematic=True,
+                 first_measure=1, tracer=NULL_TRACER):
+        self.bottom_region_height = bottom_region_height
+        self.min_time_between_clicks = min_time_between_clicks
+        self.tracker = RoiTracker() if roi_tracking else None
+        self.kinematics = KinematicTracker() if kinematic else None
+        self.tracer = tracer
+        self.wrist_history = deque(maxlen=smoothing_frames)
+        self.first_measure = first_measure
+        self.boundary_y = None
+        self.reset()
+
+    def reset(self):
+        self.wrist_history.clear()
+        if self.tracker is not None:
+            self.tracker.reset()
+        if self.kinematics is not None:
+            self.kinematics.reset()
+        self.prev_downbeat_t = None
+        self.prev_t = None
+        self.in_bottom_region = False
+        self.measure_count = self.first_measure
+
+    def process(self, frame, t, frame_id=None, point=_SEGMENT):
+        """Run one frame captured at `t` seconds and return its Decision.
+
+        Pass `point` (the glove's bottommost point, or None) when it was
+        already found elsewhere to skip segmentation.
+        """
+        start = time.perf_counter()
+        frame_dt = t - self.prev_t if self.prev_t is not None else None
+        self.prev_t = t
+        self.boundary_y = frame.shape[0] - self.bottom_region_height
+
+        # RED DETECTION
+        if point is _SEGMENT:
+            if self.tracker is not None:
+                point = self.tracker.locate(frame)
+            else:
+                point = find_red_bottommost(frame)
+        segment_end = time.perf_counter()
+        self.tracer.complete("segment", start, segment_end, frame_id)
+
+        downbeat = False
+        smoothed_y = vy = downbeat_t = None
+        if point is not None:
+            if self.kinematics is not None:
+                prev_t = self.kinematics.t
+                continuing = prev_t is not None and t - prev_t <= self.kinematics.max_coast
+                smoothed_y = self.kinematics.update(t, point[1])
+                vy = self.kinematics.vy
+                moving_down = continuing and vy > 0
+            else:
+                self.wrist_history.append(point)
+                ys = [p[1] for p in self.wrist_history]
+                moving_down = False
+                if len(ys) >= 2:
+                    smoothed_y = int(sum(ys) / len(ys))
+                    dy = smoothed_y - int(sum(ys[:-1]) / (len(ys) - 1))
+                    vy = dy / frame_dt if frame_dt else None
+                    moving_down = dy > 0
+
+            if smoothed_y is not None:
+                now_in_bottom = smoothed_y > self.boundary_y
+                new_downbeat = now_in_bottom and not self.in_bottom_region and moving_down
+                self.in_bottom_region = now_in_bottom
+
+                if new_downbeat:
+                    downbeat_t = t
+                    if self.kinematics is not None:
+                        crossing = self.kinematics.crossing_time(self.boundary_y, prev_t)
+                        if crossing is not None:
+                            downbeat_t = crossing
+                    if (self.prev_downbeat_t is None
+                            or downbeat_t - self.prev_downbeat_t > self.min_time_between_clicks):
+                        downbeat = True
+                        self.prev_downbeat_t = downbeat_t
+                        self.measure_count += 1
+                    else:
+                        downbeat_t = None
+
+        self.tracer.complete("decide", segment_end, time.perf_counter(), frame_id)
+        return Decision(frame_id, t, downbeat, self.measure_count, point, smoothed_y, vy, downbeat_t)
@@ -0,0 +1,83 @@
+import asyncio
+
+from flowstate.queues import LoopHandoff
+
+# ================= CONFIG =================
+TOPICS = ("beat", "downbeat", "status")
+MAX_QUEUED = 256  # undelivered messages before the oldest is dropped
+
+
+class EventBus:
+    """Topic-based hand-off from detector threads to the server's event loop.
+
+    publish() may be called from any thread and never blocks: messages go
+    through one bounded LoopHandoff (the same one Broadcaster uses), which
+    delivers them on the loop in publish order. There each subscriber of
+    the message's topic is called, so subscribers can use loop-bound
+    objects such as WebSockets or a Broadcaster directly.
+
+    Nothing is queued until start() has bound the bus to a running loop;
+    before that no one can be subscribed.
+    """
+
+    def __init__(self, topics=TOPICS, maxsize=MAX_QUEUED):
+        self.topics = tuple(topics)
+        self.subscribers = {topic: [] for topic in self.topics}
+        self.published = 0
+        self.delivered = 0
+        self.subscriber_errors = 0
+        self._handoff = LoopHandoff(self._deliver_batch, maxsize=maxsize)
+
+    # ---------------- LOOP ----------------
+    @property
+    def loop(self):
+        return self._handoff.loop
+
+    def start(self):
+        """Bind to the running loop (idempotent)"""
+        self._handoff.bind(asyncio.get_running_loop())
+
+    def _deliver_batch(self, batch):
+        for topic, message in batch:
+            self._deliver(topic, message)
+
+    def _deliver(self, topic, message):
+        for callback in list(self.subscribers[topic]):
+            try:
+                callback(topic, message)
+                self.delivered += 1
+            except Exception as e:
+                self.subscriber_errors += 1
+                print(f"Event bus subscriber failed on {topic}: {e}")
+
+    def close(self):
+        self._handoff.bind(None)
+
+    # ---------------- SUBSCRIBE (event loop) ----------------
+    def subscribe(self, callback, topics=None):
+        """Call callback(topic, message) on the loop for every message on `topics`
+        (all topics by default). Returns a function that unsubscribes."""
+        topics = self.topics if topics is None else tuple(topics)
+        unknown = set(topics) - set(self.topics)
+        if unknown:
+            raise ValueError(f"Unknown topics {sorted(unknown)}; expected some of {self.topics}")
+        for topic in topics:
+            self.subscribers[topic].append(callback)
+
+        def unsubscribe():
+            for topic in topics:
+                if callback in self.subscribers[topic]:
+                    self.subscribers[topic].remove(callback)
+        return unsubscribe
+
+    # ---------------- PUBLISH (any thread) ----------------
+    def publish(self, topic, message):
+        if topic not in self.subscribers:
+            raise ValueError(f"Unknown topic {topic!r}; expected one of {self.topics}")
+        if self._handoff.put((topic, message)):
+            self.published += 1
+
+    def stats(self):
+        return {"published": self.published, "delivered": self.delivered,
+                "dropped": self._handoff.dropped, "queued": len(self._handoff),
+                "subscribers": {t: len(s) for t, s in self.subscribers.items()}}
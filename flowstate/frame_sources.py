@@ -0,0 +1,154 @@
+"""Pluggable frame sources for the detection pipeline.
+
+Every source is an iterable of (frame_id, t, frame): frame ids count up
+from 1 and t is the capture time in seconds on the source's own clock
+(time.perf_counter() for a camera, media time for files and arrays).
+
+Offline sources run as fast as they can be decoded; pass realtime=True to
+pace them to their timestamps instead, e.g. to demo a recording live.
+"""
+import os
+import re
+import time
+import cv2
+import numpy as np
+
+# ================= CONFIG =================
+DEFAULT_FPS = 30.0
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    fps = None
+    perf_clock = False  # t is time.perf_counter() (a camera), not media time
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.running = True
+
+    def _frames(self):
+        """Yield (t, frame) pairs; implemented by each source"""
+        raise NotImplementedError
+
+    def __iter__(self):
+        start_perf = start_t = None
+        for frame_id, (t, frame) in enumerate(self._frames(), 1):
+            if not self.running:
+                return
+            if self.realtime:
+                if start_perf is None:
+                    start_perf, start_t = time.perf_counter(), t
+                delay = start_perf + (t - start_t) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield frame_id, t, frame
+
+    def stop(self):
+        """Make iteration end at the next frame; safe from another thread"""
+        self.running = False
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CameraSource(FrameSource):
+    """An opened cv2.VideoCapture, stamped with perf_counter() when each read returns"""
+    perf_clock = True
+
+    def __init__(self, cap, retry_delay=0.01):
+        super().__init__(realtime=False)
+        self.cap = cap
+        self.retry_delay = retry_delay
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or None
+
+    def _frames(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(self.retry_delay)
+                continue
+            yield time.perf_counter(), frame
+
+    def close(self):
+        self.stop()
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, fps=None, realtime=False):
+        super().__init__(realtime)
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(f"Could not open video {path}")
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+
+    def _frames(self):
+        index = 0
+        while True:
+            ret, frame = self.cap.read()
+            if not ret:
+                return
+            yield index / self.fps, frame
+            index += 1
+
+    def close(self):
+        self.cap.release()
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+class ImageDirSource(FrameSource):
+    """Numbered still frames (frame_0001.jpg, ...) played back at `fps`"""
+
+    def __init__(self, path, fps=DEFAULT_FPS, realtime=False):
+        super().__init__(realtime)
+        self.fps = fps or DEFAULT_FPS
+        self.files = sorted((f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS)),
+                            key=_natural_key)
+        self.files = [os.path.join(path, f) for f in self.files]
+        if not self.files:
+            raise FileNotFoundError(f"No images in {path}")
+
+    def _frames(self):
+        for index, file_path in enumerate(self.files):
+            frame = cv2.imread(file_path)
+            if frame is not None:
+                yield index / self.fps, frame
+
+
+class ArraySource(FrameSource):
+    """Frames already in memory: a (N, H, W, 3) array or a list of frames"""
+
+    def __init__(self, frames, fps=DEFAULT_FPS, timestamps=None, realtime=False):
+        super().__init__(realtime)
+        self.frames = frames
+        self.fps = fps or DEFAULT_FPS
+        self.timestamps = timestamps
+
+    def _frames(self):
+        for index, frame in enumerate(self.frames):
+            t = self.timestamps[index] if self.timestamps is not None else index / self.fps
+            yield float(t), np.asarray(frame)
+
+
+def open_source(spec, fps=None, realtime=False):
+    """Frame source from a CLI-style spec: camera index, image folder, .npy or video file"""
+    if isinstance(spec, int) or str(spec).isdigit():
+        from flowstate.capture import GrabberSource, LatestFrameGrabber, open_capture
+        cap = open_capture(int(spec))
+        if cap is None:
+            raise FileNotFoundError(f"Could not open camera {spec}")
+        return GrabberSource(LatestFrameGrabber(cap))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, fps=fps or DEFAULT_FPS, realtime=realtime)
+    if spec.endswith(".npy"):
+        return ArraySource(np.load(spec, mmap_mode="r"), fps=fps or DEFAULT_FPS, realtime=realtime)
+    return VideoFileSource(spec, fps=fps, realtime=realtime)
@@ -0,0 +1,239 @@
+"""CPU inference backends for the YOLO baton trackers.
+
+Every backend is called as backend(frame) -> (boxes, scores, classes),
+boxes as (x1, y1, x2, y2) in frame pixels. Each backend runs at a
+configurable input size and with a pinned thread count. The wanted
+classes are filtered before NMS, so nothing is spent on the 79 COCO
+classes we ignore. Every call is timed into a histogram.
+
+    python -m flowstate.inference export yolov8n.pt --format onnx --imgsz 320
+    python -m flowstate.inference bench yolov8n.onnx --video phone.mp4
+
+load_backend() picks the runtime from the file: .onnx -> ONNX Runtime,
+*_openvino_model/ or .xml -> OpenVINO, anything else -> ultralytics.
+"""
+import argparse
+import os
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+# ================= CONFIG =================
+DEFAULT_IMGSZ = 320
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.45
+HISTOGRAM_BINS_MS = (5, 10, 20, 30, 50, 75, 100, 150, 250, 500)
+LETTERBOX_FILL = 114
+
+
+class InferenceTimer:
+    """Per-call latency histogram plus a window of recent samples for percentiles"""
+
+    def __init__(self, bins_ms=HISTOGRAM_BINS_MS, window=1000):
+        self.bins_ms = bins_ms
+        self.counts = np.zeros(len(bins_ms) + 1, np.int64)
+        self.recent = deque(maxlen=window)
+        self.total = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1e3
+        self.counts[np.searchsorted(self.bins_ms, ms)] += 1
+        self.recent.append(ms)
+        self.total += seconds
+
+    @property
+    def calls(self):
+        return int(self.counts.sum())
+
+    def report(self):
+        if not self.calls:
+            return "no inference calls"
+        recent = np.array(self.recent)
+        lines = [f"{self.calls} calls, mean {self.total / self.calls * 1e3:.1f} ms, "
+                 f"p50 {np.percentile(recent, 50):.1f} ms, p95 {np.percentile(recent, 95):.1f} ms"]
+        edges = ("0",) + tuple(str(b) for b in self.bins_ms)
+        peak = max(self.counts.max(), 1)
+        for i, count in enumerate(self.counts):
+            label = f"{edges[i]}-{self.bins_ms[i]}" if i < len(self.bins_ms) else f">{edges[i]}"
+            lines.append(f"  {label:>9} ms {count:6d} {'#' * int(40 * count / peak)}")
+        return "\n".join(lines)
+
+
+# ================= BACKENDS =================
+class Backend:
+    def __init__(self, imgsz=DEFAULT_IMGSZ, classes=None, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD):
+        self.imgsz = imgsz
+        self.classes = list(classes) if classes is not None else None
+        self.conf = conf
+        self.iou = iou
+        self.timer = InferenceTimer()
+
+    def _infer(self, frame):
+        raise NotImplementedError
+
+    def __call__(self, frame):
+        start = time.perf_counter()
+        result = self._infer(frame)
+        self.timer.record(time.perf_counter() - start)
+        return result
+
+    def warmup(self, runs=2):
+        """First calls allocate and pick kernels; keep them out of the loop and the stats"""
+        dummy = np.full((self.imgsz, self.imgsz, 3), LETTERBOX_FILL, np.uint8)
+        for _ in range(runs):
+            self._infer(dummy)
+
+
+class UltralyticsBackend(Backend):
+    """The ultralytics YOLO wrapper; also loads its own .onnx / OpenVINO exports"""
+
+    def __init__(self, weights="yolov8n.pt", threads=DEFAULT_THREADS, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+
+    def _infer(self, frame):
+        result = self.model(frame, imgsz=self.imgsz, classes=self.classes, conf=self.conf,
+                            iou=self.iou, verbose=False)[0]
+        boxes = result.boxes
+        return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy().astype(int)
+
+
+class RawYoloBackend(Backend):
+    """Letterbox pre-processing and YOLOv8 (1, 4 + classes, anchors) post-processing"""
+
+    def _preprocess(self, frame):
+        h, w = frame.shape[:2]
+        r = min(self.imgsz / h, self.imgsz / w)
+        nh, nw = int(round(h * r)), int(round(w * r))
+        top, left = (self.imgsz - nh) // 2, (self.imgsz - nw) // 2
+        padded = np.full((self.imgsz, self.imgsz, 3), LETTERBOX_FILL, np.uint8)
+        padded[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        blob = cv2.dnn.blobFromImage(padded, 1 / 255.0, swapRB=True)
+        return blob, r, left, top
+
+    def _postprocess(self, output, r, left, top):
+        pred = output[0].T  # (anchors, 4 + classes)
+        scores = pred[:, 4:]
+        if self.classes is not None:
+            # Only the wanted classes' columns compete; the rest never reach NMS
+            wanted = np.asarray(self.classes)
+            best = scores[:, wanted].argmax(axis=1)
+            cls = wanted[best]
+        else:
+            cls = scores.argmax(axis=1)
+        score = scores[np.arange(len(scores)), cls]
+        keep = score > self.conf
+        if not keep.any():
+            return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int)
+        cx, cy, bw, bh = pred[keep, :4].T
+        score, cls = score[keep], cls[keep]
+        boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        boxes = (boxes - [left, top, left, top]) / r
+
+        # Class-aware NMS in one call: shift each class to its own region
+        shifted = boxes + (cls * 4096.0)[:, None]
+        xywh = np.column_stack([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]])
+        idx = np.array(cv2.dnn.NMSBoxes(xywh.tolist(), score.tolist(), self.conf, self.iou), int).ravel()
+        return boxes[idx].astype(np.float32), score[idx].astype(np.float32), cls[idx]
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+    def _infer(self, frame):
+        blob, r, left, top = self._preprocess(frame)
+        return self._postprocess(self._run(blob), r, left, top)
+
+
+class OnnxBackend(RawYoloBackend):
+    def __init__(self, path, threads=DEFAULT_THREADS, **kwargs):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        size = self.session.get_inputs()[0].shape[-1]
+        if isinstance(size, int):
+            kwargs["imgsz"] = size  # static export: the model decides
+        super().__init__(**kwargs)
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(RawYoloBackend):
+    def __init__(self, path, threads=DEFAULT_THREADS, **kwargs):
+        import openvino as ov
+        if os.path.isdir(path):
+            path = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".xml"))
+        core = ov.Core()
+        model = core.read_model(path)
+        size = model.inputs[0].get_partial_shape()[-1]
+        if size.is_static:
+            kwargs["imgsz"] = size.get_length()
+        self.compiled = core.compile_model(model, "CPU", {"INFERENCE_NUM_THREADS": threads,
+                                                          "PERFORMANCE_HINT": "LATENCY"})
+        self.request = self.compiled.create_infer_request()
+        super().__init__(**kwargs)
+
+    def _run(self, blob):
+        return self.request.infer({0: blob})[self.compiled.output(0)]
+
+
+def load_backend(path, imgsz=DEFAULT_IMGSZ, classes=None, threads=DEFAULT_THREADS,
+                 conf=CONF_THRESHOLD, iou=IOU_THRESHOLD):
+    kwargs = dict(imgsz=imgsz, classes=classes, threads=threads, conf=conf, iou=iou)
+    if path.endswith(".onnx"):
+        return OnnxBackend(path, **kwargs)
+    if path.endswith(".xml") or path.rstrip("/\\").endswith("_openvino_model"):
+        return OpenVinoBackend(path, **kwargs)
+    return UltralyticsBackend(path, **kwargs)
+
+def export_model(weights="yolov8n.pt", fmt="onnx", imgsz=DEFAULT_IMGSZ):
+    """One-off export of ultralytics weights to a CPU runtime format; returns its path"""
+    from ultralytics import YOLO
+    return YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=False, half=False)
+
+# ================= CLI =================
+def main():
+    parser = argparse.ArgumentParser(description="Export or benchmark YOLO CPU inference backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="export ultralytics weights for ONNX Runtime / OpenVINO")
+    export.add_argument("weights", nargs="?", default="yolov8n.pt")
+    export.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    export.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    bench = sub.add_parser("bench", help="time a model on a recording (or blank frames)")
+    bench.add_argument("model")
+    bench.add_argument("--video")
+    bench.add_argument("--frames", type=int, default=100)
+    bench.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    bench.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    bench.add_argument("--classes", type=int, nargs="*", default=[67], help="COCO ids to keep (67 = phone)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Exported {export_model(args.weights, args.format, args.imgsz)}")
+        return
+
+    from flowstate.bench_segmentation import synthetic_frames, video_frames
+    frames = video_frames(args.video, args.frames) if args.video else synthetic_frames(args.frames)
+    backend = load_backend(args.model, imgsz=args.imgsz, classes=args.classes or None,
+                           threads=args.threads)
+    backend.warmup()
+    for frame in frames:
+        backend(frame)
+    print(f"{args.model} at {backend.imgsz}px, {args.threads} threads")
+    print(backend.timer.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Constant-acceleration Kalman tracker for the glove's vertical position.
+
+State is (y, vy, ay) in pixels and seconds, downwards positive. Frames may
+arrive at any spacing; the process noise is white jerk, scaled for each
+step's dt. Between two frames the filtered trajectory is a parabola, so
+the moment it crossed a line can be solved for instead of being rounded
+to the frame that first saw it on the other side.
+"""
+import numpy as np
+
+# ================= CONFIG =================
+JERK_NOISE = 5e6        # (px/s^3)^2 * s, how quickly acceleration may change
+MEASUREMENT_STD = 3.0   # px, segmentation jitter of the bottommost point
+MAX_COAST = 0.25        # seconds without a measurement before the track is dropped
+
+
+class KinematicTracker:
+    def __init__(self, jerk_noise=JERK_NOISE, measurement_std=MEASUREMENT_STD, max_coast=MAX_COAST):
+        self.jerk_noise = jerk_noise
+        self.r = measurement_std ** 2
+        self.max_coast = max_coast
+        self.reset()
+
+    def reset(self):
+        self.x = None           # (y, vy, ay)
+        self.P = None
+        self.t = None           # time of the current estimate
+        self.last_measured = None
+
+    @property
+    def y(self):
+        return None if self.x is None else float(self.x[0])
+
+    @property
+    def vy(self):
+        return None if self.x is None else float(self.x[1])
+
+    @staticmethod
+    def _transition(dt):
+        return np.array([[1.0, dt, 0.5 * dt * dt],
+                         [0.0, 1.0, dt],
+                         [0.0, 0.0, 1.0]])
+
+    def _process_noise(self, dt):
+        d2, d3, d4, d5 = dt ** 2, dt ** 3, dt ** 4, dt ** 5
+        return self.jerk_noise * np.array([[d5 / 20, d4 / 8, d3 / 6],
+                                           [d4 / 8, d3 / 3, d2 / 2],
+                                           [d3 / 6, d2 / 2, dt]])
+
+    def predict(self, t):
+        """Advance the estimate to time t without a measurement"""
+        if self.x is None or t <= self.t:
+            return
+        if t - self.last_measured > self.max_coast:
+            self.reset()  # lost the glove for too long, the old motion means nothing
+            return
+        dt = t - self.t
+        F = self._transition(dt)
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + self._process_noise(dt)
+        self.t = t
+
+    def update(self, t, y):
+        """Fold in a measured position at time t; returns the filtered y"""
+        self.predict(t)
+        if self.x is None:
+            self.x = np.array([float(y), 0.0, 0.0])
+            # Unknown motion: wide velocity / acceleration priors
+            self.P = np.diag([self.r, 1e6, 1e8])
+        else:
+            # H = [1, 0, 0]
+            innovation = y - self.x[0]
+            s = self.P[0, 0] + self.r
+            k = self.P[:, 0] / s
+            self.x = self.x + k * innovation
+            self.P = self.P - np.outer(k, self.P[0])
+        self.t = self.last_measured = t
+        return float(self.x[0])
+
+    def crossing_time(self, boundary, t_prev):
+        """When, after t_prev, the current trajectory passed `boundary`.
+
+        Solves y + vy*s + ay*s^2/2 = boundary for the latest s in
+        [t_prev - t, 0]; None if the parabola does not cross it there.
+        """
+        if self.x is None or t_prev is None:
+            return None
+        y, v, a = self.x
+        span = self.t - t_prev
+        if a == 0.0:
+            roots = [(boundary - y) / v] if v else []
+        else:
+            disc = v * v - 2.0 * a * (y - boundary)
+            if disc < 0:
+                return None
+            sq = np.sqrt(disc)
+            roots = [(-v + sq) / a, (-v - sq) / a]
+        roots = [s for s in roots if -span <= s <= 0.0]
+        return self.t + max(roots) if roots else None
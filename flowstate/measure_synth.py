@@ -0,0 +1,231 @@
+"""Measure announcements spliced together from a small bank of spoken words.
+
+Instead of one recording per measure number, "Measure 347" is built at
+runtime from the word clips "measure", "three", "hundred", "forty",
+"seven". About thirty clips cover every measure up to 999,999:
+
+    python -m flowstate.measure_tts --words
+    python -m flowstate.measure_synth 347 -o measure_347.wav
+
+Clips are prepared for the output rate once (see cue_prep), so splicing
+is just adding a few float arrays with short crossfades where the words
+meet. Results are kept in an LRU, and each request starts assembling the
+announcement that will most likely be asked for next in the background,
+so the one after is ready before its downbeat.
+
+MeasureAudio puts it behind the same dict-like interface as AudioBank:
+recorded measures come from the bank, the rest are synthesized.
+"""
+import argparse
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.io import wavfile
+
+from flowstate.audio_bank import DEVICE_RATE, open_measure_bank
+from flowstate.cue_prep import CueCache, to_int16
+
+# ================= CONFIG =================
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_WORD_DIR = os.path.join(REPO_ROOT, "measure_words")
+CACHE_SIZE = 16
+CROSSFADE_MS = 12         # overlap where two words meet
+PAUSE_MS = 60             # extra silence after "measure"
+MAX_MEASURE = 999_999
+
+ONES = ["", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine",
+        "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen",
+        "seventeen", "eighteen", "nineteen"]
+TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+WORDS = ["measure"] + ONES[1:] + TENS[2:] + ["hundred", "thousand"]
+
+
+def _below_thousand(n):
+    hundreds, rest = divmod(n, 100)
+    words = [ONES[hundreds], "hundred"] if hundreds else []
+    if rest >= 20:
+        tens, ones = divmod(rest, 10)
+        words.append(TENS[tens])
+        if ones:
+            words.append(ONES[ones])
+    elif rest:
+        words.append(ONES[rest])
+    return words
+
+def number_words(n):
+    """347 -> ["three", "hundred", "forty", "seven"]"""
+    if not 1 <= n <= MAX_MEASURE:
+        raise ValueError(f"Can only say measures 1-{MAX_MEASURE}, not {n}")
+    thousands, rest = divmod(n, 1000)
+    words = _below_thousand(thousands) + ["thousand"] if thousands else []
+    return words + _below_thousand(rest)
+
+def word_path(word_dir, word):
+    return os.path.join(word_dir, f"word_{word}.wav")
+
+
+class MeasureSynth:
+    """Dict-like: synth[measure] -> float32 announcement at `sample_rate`"""
+
+    def __init__(self, word_dir=DEFAULT_WORD_DIR, sample_rate=DEVICE_RATE, cache_size=CACHE_SIZE,
+                 crossfade_ms=CROSSFADE_MS, pause_ms=PAUSE_MS, cache=None):
+        self.sample_rate = sample_rate
+        self.cache_size = cache_size
+        cache = cache or CueCache(sample_rate)
+        missing = [w for w in WORDS if not os.path.exists(word_path(word_dir, w))]
+        if missing:
+            raise FileNotFoundError(f"{word_dir} is missing word clips: {', '.join(missing)}")
+        self.words = {w: cache.load(word_path(word_dir, w)).astype(np.float32) / 32768.0 for w in WORDS}
+
+        self.crossfade = int(sample_rate * crossfade_ms / 1000)
+        self.pause = int(sample_rate * pause_ms / 1000)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}                     # measure -> Future being assembled
+        self._prefetcher = ThreadPoolExecutor(max_workers=1)
+        self._last = None
+
+    # ---------------- ASSEMBLY ----------------
+    def assemble(self, n):
+        """Splice "measure" and the words of n into one float32 array"""
+        clips = [self.words[w] for w in ["measure"] + number_words(n)]
+        lengths = np.array([len(c) for c in clips])
+        k = min(self.crossfade, int(lengths.min()) // 2)
+        ramp = np.sqrt(np.linspace(0.0, 1.0, k, dtype=np.float32))  # equal power across the overlap
+
+        # Each word starts k samples before the previous one ends
+        starts = np.concatenate([[0], np.cumsum(lengths[:-1] - k)])
+        starts[1:] += self.pause
+        out = np.zeros(int(starts[-1] + lengths[-1]), dtype=np.float32)
+        for i, (clip, start) in enumerate(zip(clips, starts)):
+            seg = out[start:start + len(clip)]
+            seg += clip
+            if k and i > 0:
+                seg[:k] -= clip[:k] * (1.0 - ramp)
+            if k and i < len(clips) - 1:
+                seg[-k:] -= clip[-k:] * (1.0 - ramp[::-1])
+        return out
+
+    # ---------------- CACHE ----------------
+    def _remember(self, n, data):
+        with self._lock:
+            self._cache[n] = data
+            self._cache.move_to_end(n)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _build(self, n):
+        data = self.assemble(n)
+        self._remember(n, data)
+        return data
+
+    def prefetch(self, n):
+        """Start assembling measure n in the background if it is not ready"""
+        if not 1 <= n <= MAX_MEASURE:
+            return
+        with self._lock:
+            if n in self._cache or n in self._pending:
+                return
+            future = self._pending[n] = self._prefetcher.submit(self._build, n)
+        future.add_done_callback(lambda _: self._pending.pop(n, None))
+
+    def __getitem__(self, n):
+        with self._lock:
+            data = self._cache.get(n)
+            if data is not None:
+                self._cache.move_to_end(n)
+            pending = self._pending.get(n)
+            # Announcements come at a steady stride (every measure, every 4, ...)
+            stride = n - self._last if self._last is not None and n > self._last else 1
+            self._last = n
+        if data is None:
+            data = pending.result() if pending is not None else self._build(n)
+        self.prefetch(n + stride)
+        return data
+
+    def get(self, n, default=None):
+        return self[n] if n in self else default
+
+    def __contains__(self, n):
+        return isinstance(n, (int, np.integer)) and 1 <= n <= MAX_MEASURE
+
+    def __len__(self):
+        return MAX_MEASURE
+
+    def close(self):
+        self._prefetcher.shutdown(wait=False)
+
+
+class MeasureAudio:
+    """Recorded announcements where there are any, synthesized ones for the rest"""
+
+    def __init__(self, bank=None, synth=None):
+        if bank is None and synth is None:
+            raise ValueError("Need a measure bank, a word bank, or both")
+        self.bank = bank
+        self.synth = synth
+
+    def __getitem__(self, n):
+        if self.bank is not None and n in self.bank:
+            return self.bank[n]
+        if self.synth is None:
+            raise KeyError(n)
+        return self.synth[n]
+
+    def get(self, n, default=None):
+        return self[n] if n in self else default
+
+    def __contains__(self, n):
+        return (self.bank is not None and n in self.bank) or (self.synth is not None and n in self.synth)
+
+    def __len__(self):
+        return len(self.synth) if self.synth is not None else len(self.bank)
+
+    def describe(self):
+        parts = []
+        if self.bank is not None:
+            parts.append(f"{len(self.bank)} recorded measures")
+        if self.synth is not None:
+            parts.append(f"word bank up to measure {MAX_MEASURE}")
+        return " + ".join(parts)
+
+def open_measure_audio(wav_dir, word_dir=DEFAULT_WORD_DIR, sample_rate=DEVICE_RATE):
+    """Bank of recorded measures from `wav_dir` (if it has any), with the
+    word bank in `word_dir` (if it is there) filling in every other measure"""
+    bank = synth = None
+    try:
+        bank = open_measure_bank(wav_dir, sample_rate=sample_rate)
+    except FileNotFoundError:
+        pass
+    if os.path.isdir(word_dir):
+        synth = MeasureSynth(word_dir, sample_rate)
+    return MeasureAudio(bank, synth)
+
+def wav_bytes(data, sample_rate):
+    """A float32 announcement as WAV file bytes, for pages that play it themselves"""
+    buf = io.BytesIO()
+    wavfile.write(buf, sample_rate, to_int16(data))
+    return buf.getvalue()
+
+# ================= CLI =================
+def main():
+    parser = argparse.ArgumentParser(description="Splice a measure announcement from the word bank")
+    parser.add_argument("measure", type=int)
+    parser.add_argument("--words", default=DEFAULT_WORD_DIR, help="folder of word_*.wav clips")
+    parser.add_argument("--rate", type=int, default=DEVICE_RATE)
+    parser.add_argument("-o", "--output", help="write the announcement to this WAV file")
+    args = parser.parse_args()
+    synth = MeasureSynth(args.words, args.rate)
+    print(" ".join(["measure"] + number_words(args.measure)))
+    data = synth[args.measure]
+    print(f"{len(data) / args.rate:.2f} s, {sum(len(w) for w in synth.words.values()) * 2 // 1024} KB of words")
+    if args.output:
+        wavfile.write(args.output, args.rate, to_int16(data))
+    synth.close()
+
+if __name__ == "__main__":
+    main()
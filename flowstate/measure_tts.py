@@ -0,0 +1,203 @@
+"""Parallel, incremental generation of measure announcements with pyttsx3.
+
+    python -m flowstate.measure_tts 1-300 --out measureDetectorProject/measure_wavs
+    python -m flowstate.measure_tts 301-1200,1500 --voice english_rp --rate 170 --jobs 8
+    python -m flowstate.measure_tts --words
+    python -m flowstate.measure_tts --list-voices
+
+Measures are split into chunks across a process pool, each worker with
+its own TTS engine. Every file is written as normalized mono int16 at the
+playback rate (see cue_prep), so the servers load it without resampling.
+A manifest in the output folder records a hash of what each file was made
+from (text, voice, rate, output rate); files whose hash still matches are
+skipped, so re-running after adding a range or changing the voice only
+renders what changed. --words renders the word clips measure_synth
+splices announcements from instead.
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.io import wavfile
+
+from flowstate.audio_bank import DEVICE_RATE
+from flowstate.cue_prep import PREP_VERSION, prepare_cue, to_int16
+from flowstate.measure_synth import DEFAULT_WORD_DIR, WORDS, word_path
+
+# ================= CONFIG =================
+TEXT = "Measure {n}"
+SPEECH_RATE = 150        # words per minute
+JOBS = os.cpu_count() or 1
+CHUNKS_PER_JOB = 4       # smaller chunks even out slow and fast workers
+MANIFEST = ".manifest.json"
+
+
+def parse_ranges(spec):
+    """Parse "1-4,10,12-13" into [1, 2, 3, 4, 10, 12, 13]"""
+    measures = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = (int(v) for v in part.split("-", 1))
+            if hi < lo:
+                raise ValueError(f"Empty range {part!r}")
+            measures.update(range(lo, hi + 1))
+        else:
+            measures.add(int(part))
+    return sorted(measures)
+
+def cue_hash(text, voice, rate, sample_rate):
+    key = json.dumps([text, voice, rate, sample_rate, PREP_VERSION])
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+# ================= WORKERS =================
+_engine = None
+
+def _init_engine(voice, rate):
+    global _engine
+    import pyttsx3
+    _engine = pyttsx3.init()
+    _engine.setProperty("rate", rate)
+    if voice:
+        _engine.setProperty("voice", voice)
+
+def find_voice(engine, voice):
+    """Voice id by exact id or a case-insensitive piece of its name"""
+    voices = engine.getProperty("voices")
+    for v in voices:
+        if v.id == voice:
+            return v.id
+    for v in voices:
+        if voice.lower() in (v.name or "").lower():
+            return v.id
+    raise ValueError(f"No voice matching {voice!r}; see --list-voices")
+
+def _render_chunk(jobs, sample_rate):
+    """Speak [(name, text, path)] with this worker's engine; returns the names written"""
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_paths = []
+        for i, (_, text, _) in enumerate(jobs):
+            raw_path = os.path.join(tmp, f"{i}.wav")
+            _engine.save_to_file(text, raw_path)
+            raw_paths.append(raw_path)
+        _engine.runAndWait()  # one engine run for the whole chunk
+
+        done = []
+        for (name, _, path), raw_path in zip(jobs, raw_paths):
+            fs_in, data = wavfile.read(raw_path)
+            cue = to_int16(prepare_cue(data, fs_in, sample_rate))
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            wavfile.write(tmp_path, sample_rate, cue)
+            os.replace(tmp_path, path)
+            done.append(name)
+    return done
+
+# ================= GENERATE =================
+def render(items, out_dir, voice=None, rate=SPEECH_RATE, sample_rate=DEVICE_RATE,
+           jobs=JOBS, force=False):
+    """Speak [(file name, text)] into out_dir, skipping files that are up to date"""
+    voice = resolve_voice(voice)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    todo = []
+    for name, spoken in items:
+        digest = cue_hash(spoken, voice, rate, sample_rate)
+        if not force and manifest.get(name) == digest and os.path.exists(os.path.join(out_dir, name)):
+            continue
+        todo.append((name, spoken, os.path.join(out_dir, name), digest))
+    skipped = len(items) - len(todo)
+    if not todo:
+        print(f"All {len(items)} files up to date in {out_dir}")
+        return 0
+
+    n_chunks = min(len(todo), max(1, jobs) * CHUNKS_PER_JOB)
+    chunks = [todo[i::n_chunks] for i in range(n_chunks)]
+    digests = {name: digest for name, _, _, digest in todo}
+    written = 0
+    with ProcessPoolExecutor(max_workers=min(jobs, n_chunks), initializer=_init_engine,
+                             initargs=(voice, rate)) as pool:
+        futures = [pool.submit(_render_chunk, [job[:3] for job in chunk], sample_rate)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            for name in future.result():
+                manifest[name] = digests[name]
+                written += 1
+            save_manifest(out_dir, manifest)  # a crash keeps the finished chunks
+            print(f"  {written}/{len(todo)} rendered")
+    print(f"Wrote {written} files to {out_dir} ({skipped} up to date)")
+    return written
+
+def generate(measures, out_dir, voice=None, rate=SPEECH_RATE, sample_rate=DEVICE_RATE,
+             text=TEXT, jobs=JOBS, force=False):
+    """Render the announcements for `measures` that are missing or out of date"""
+    items = [(f"measure_{measure}.wav", text.format(n=measure)) for measure in measures]
+    return render(items, out_dir, voice, rate, sample_rate, jobs, force)
+
+def generate_words(out_dir, voice=None, rate=SPEECH_RATE, sample_rate=DEVICE_RATE, jobs=JOBS, force=False):
+    """Render the word clips for measure_synth"""
+    items = [(os.path.basename(word_path("", word)), word) for word in WORDS]
+    return render(items, out_dir, voice, rate, sample_rate, jobs, force)
+
+def resolve_voice(voice):
+    """Check the voice in this process, so a typo fails before the pool starts"""
+    if not voice:
+        return None
+    import pyttsx3
+    return find_voice(pyttsx3.init(), voice)
+
+def list_voices():
+    import pyttsx3
+    engine = pyttsx3.init()
+    for v in engine.getProperty("voices"):
+        print(f"{v.id}\t{v.name}")
+
+# ================= CLI =================
+def main(default_measures=None, default_out="measure_wavs"):
+    parser = argparse.ArgumentParser(description="Generate measure announcement WAVs")
+    parser.add_argument("measures", nargs="?", default=default_measures,
+                        help="measures to render, e.g. 1-300 or 1-16,32,64-80")
+    parser.add_argument("--out", help=f"output folder (default {default_out}, or the shared "
+                                      f"measure_words folder with --words)")
+    parser.add_argument("--voice", help="pyttsx3 voice id or part of its name")
+    parser.add_argument("--rate", type=int, default=SPEECH_RATE, help="speaking rate, words per minute")
+    parser.add_argument("--sample-rate", type=int, default=DEVICE_RATE, help="playback rate of the output files")
+    parser.add_argument("--text", default=TEXT, help="what to say; {n} is the measure number")
+    parser.add_argument("--jobs", type=int, default=JOBS)
+    parser.add_argument("--words", action="store_true", help="render the word clips for measure_synth instead")
+    parser.add_argument("--force", action="store_true", help="render even files that are up to date")
+    parser.add_argument("--list-voices", action="store_true")
+    args = parser.parse_args()
+
+    if args.list_voices:
+        list_voices()
+        return
+    if not args.measures and not args.words:
+        parser.error("give the measures to render, e.g. 1-300")
+    try:
+        if args.words:
+            generate_words(args.out or DEFAULT_WORD_DIR, args.voice, args.rate, args.sample_rate, args.jobs, args.force)
+            return
+        generate(parse_ranges(args.measures), args.out or default_out, args.voice, args.rate, args.sample_rate,
+                 args.text, args.jobs, args.force)
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
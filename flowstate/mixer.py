@@ -0,0 +1,180 @@
+import itertools
+import time
+from collections import deque
+import numpy as np
+
+from flowstate.tracing import NULL_TRACER
+
+# ================= CONFIG =================
+FS = 44100
+BLOCKSIZE = 256
+MAX_VOICES = 16
+
+
+class Mixer:
+    """Fixed voice-pool mixer for the sounddevice output callback.
+
+    play() never takes a lock: requests go through a deque that only the
+    audio callback drains (deque append/popleft are atomic). All voice
+    state lives in preallocated arrays, and each block is mixed with a
+    single sum over the active voices.
+
+    play(sound, at=t) starts the sound at time.perf_counter() time t, to
+    the sample, using the DAC time PortAudio reports for the block. Without
+    `at` the sound starts at the beginning of the next block, as before.
+    """
+
+    def __init__(self, fs=FS, blocksize=BLOCKSIZE, max_voices=MAX_VOICES, tracer=NULL_TRACER):
+        self.fs = fs
+        self.tracer = tracer
+        self.blocksize = blocksize
+        self.max_voices = max_voices
+
+        self._commands = deque()
+        self._data = [None] * max_voices
+        self._pos = np.zeros(max_voices, np.int64)    # < 0: samples until start
+        self._len = np.zeros(max_voices, np.int64)
+        self._gain = np.ones(max_voices, np.float32)
+        self._active = np.zeros(max_voices, bool)
+        self._ids = np.zeros(max_voices, np.int64)     # increasing, so also start order
+        self._next_id = itertools.count(1)
+        self._scratch = np.zeros((max_voices, blocksize), np.float32)
+
+        self.stream = None
+        self.output_latency = 0.0
+        self.late_starts = 0
+        self.stolen_voices = 0
+        # Last callback timing, for diagnostics
+        self.last_callback_perf = None
+        self.last_dac_time = None
+
+    # ---------------- PRODUCER SIDE (any thread) ----------------
+    def play(self, sound, at=None, gain=1.0, trace_id=None):
+        """Queue a mono float32 sound, optionally for perf_counter() time `at`.
+
+        Returns an id that can be passed to cancel(). With a trace_id the
+        queue wait and the time the first sample reaches the DAC are traced.
+        """
+        if sound is None or len(sound) == 0:
+            return None
+        voice_id = next(self._next_id)
+        queued_at = time.perf_counter() if trace_id is not None else None
+        self._commands.append((voice_id, sound, at, gain, trace_id, queued_at))
+        return voice_id
+
+    def cancel(self, voice_id):
+        """Stop a queued or playing sound; a no-op once it has finished"""
+        if voice_id is not None:
+            self._commands.append((voice_id, None, None, None, None, None))
+
+    def time(self):
+        return time.perf_counter()
+
+    # ---------------- STREAM ----------------
+    def open_stream(self, **kwargs):
+        import sounddevice as sd
+        self.stream = sd.OutputStream(
+            samplerate=self.fs,
+            channels=1,
+            blocksize=self.blocksize,
+            dtype="float32",
+            callback=self.callback,
+            **kwargs
+        )
+        self.output_latency = self.stream.latency
+        return self.stream
+
+    def start(self, **kwargs):
+        stream = self.open_stream(**kwargs)
+        stream.start()
+        return stream
+
+    # ---------------- AUDIO CALLBACK ----------------
+    def _dac_lead(self, time_info):
+        """Seconds from now until the block being filled reaches the DAC"""
+        current = getattr(time_info, "currentTime", 0) or 0
+        dac = getattr(time_info, "outputBufferDacTime", 0) or 0
+        return dac - current if dac and current else self.output_latency
+
+    def _start_offset(self, at, now_perf, lead):
+        """Samples from the start of this block until perf_counter() time `at`"""
+        if at is None:
+            return 0
+        offset = int(round((at - now_perf - lead) * self.fs))
+        if offset < 0:
+            self.late_starts += 1
+            return 0
+        return offset
+
+    def _free_voice(self):
+        free = np.flatnonzero(~self._active)
+        if len(free):
+            return int(free[0])
+        # Pool full: steal the voice that started first
+        self.stolen_voices += 1
+        return int(self._ids.argmin())
+
+    def _drain_commands(self, now_perf, time_info):
+        lead = None
+        while self._commands:
+            voice_id, sound, at, gain, trace_id, queued_at = self._commands.popleft()
+            if sound is None:
+                # Cancel
+                hit = np.flatnonzero(self._active & (self._ids == voice_id))
+                for v in hit:
+                    self._active[v] = False
+                    self._data[v] = None
+                continue
+            if lead is None:
+                lead = self._dac_lead(time_info)
+            offset = self._start_offset(at, now_perf, lead)
+            if trace_id is not None:
+                out_time = now_perf + lead + offset / self.fs
+                self.tracer.complete("mixer queue", queued_at, now_perf, trace_id, cat="audio")
+                self.tracer.complete("audio out", now_perf, out_time, trace_id, cat="audio",
+                                     dac_time=getattr(time_info, "outputBufferDacTime", None),
+                                     offset_samples=offset)
+            v = self._free_voice()
+            self._data[v] = sound
+            self._len[v] = len(sound)
+            self._pos[v] = -offset
+            self._gain[v] = gain
+            self._active[v] = True
+            self._ids[v] = voice_id
+
+    def callback(self, outdata, frames, time_info, status):
+        now_perf = time.perf_counter()
+        self.last_callback_perf = now_perf
+        self.last_dac_time = getattr(time_info, "outputBufferDacTime", None)
+        self._drain_commands(now_perf, time_info)
+
+        if frames > self._scratch.shape[1]:
+            self._scratch = np.zeros((self.max_voices, frames), np.float32)
+
+        voices = np.flatnonzero(self._active)
+        if not len(voices):
+            outdata.fill(0)
+            return
+
+        # Gather each voice's slice of this block into its scratch row
+        rows = self._scratch[:len(voices), :frames]
+        rows.fill(0)
+        for row, v in zip(rows, voices):
+            pos = int(self._pos[v])
+            dst = max(-pos, 0)
+            if dst >= frames:
+                continue
+            src = max(pos, 0)
+            n = min(int(self._len[v]) - src, frames - dst)
+            np.multiply(self._data[v][src:src + n], self._gain[v], out=row[dst:dst + n])
+
+        # Mix and advance every voice in one go
+        np.sum(rows, axis=0, out=outdata[:, 0])
+        if outdata.shape[1] > 1:
+            outdata[:, 1:] = outdata[:, :1]
+        self._pos[voices] += frames
+        done = voices[self._pos[voices] >= self._len[voices]]
+        if len(done):
+            self._active[done] = False
+            for v in done:
+                self._data[v] = None
@@ -0,0 +1,463 @@
+"""Several beat detectors on one capture, fused into a single beat stream.
+
+    python -m flowstate.multi_detector rehearsal.mp4
+    python -m flowstate.multi_detector 0 --detectors zone,velocity
+    python -m flowstate.multi_detector clip.npy --separate     # cost without sharing
+    python -m flowstate.multi_detector rehearsal.mp4 --annotations downbeats.csv
+
+Each frame is wrapped in a FrameProducts, which computes what detectors
+derive from it (grayscale for the tracker, the largest red blob) on
+first use and hands the same result to every detector that asks. Each
+DetectorPlugin turns the frame into beat candidates with a confidence,
+timed at the ictus, the bottom of the stroke: each detector sees the
+downbeat at a different point of it (the zone detector at the boundary
+crossing, the velocity and baton detectors at the top of the
+preparation), so downbeats are held until the stroke bottoms out, and
+each plugin's `latency` is taken off its times. BeatFusion groups candidates from different
+detectors that fall within a short window and emits one beat when their
+weighted confidence is high enough. With --annotations the CLI reports
+each detector's own downbeat recall and timing offset, which is what the
+latencies and FUSION_THRESHOLD are set from.
+"""
+import argparse
+import time
+from collections import Counter, defaultdict, namedtuple
+import cv2
+import numpy as np
+
+from flowstate.baton import BeatCounter, DetectThenTrack
+from flowstate.downbeat_detector import DownbeatDetector
+from flowstate.frame_sources import open_source
+from flowstate.replay_bench import TOLERANCE, score, stage_times
+from flowstate.segmentation import default_segmenter
+from flowstate.tracing import NULL_TRACER, Tracer
+from flowstate.velocity_beats import VelocityBeatDetector
+
+# ================= CONFIG =================
+FUSION_WINDOW = 0.12      # seconds; candidates this close together are the same beat
+FUSION_THRESHOLD = 0.3    # share of the total detector weight a beat needs: a confident
+                          # zone downbeat alone, or the other two agreeing
+ZONE_FULL_SPEED = 600.0   # px/s crossing speed at which a zone downbeat has confidence 1
+MAX_DOWNSTROKE = 1.0      # seconds from the top of a stroke to its bottom before giving up
+STROKE_REBOUND = 6.0      # px the hand must come back up to mark the bottom of the stroke
+DETECTORS = ("zone", "velocity", "baton")
+
+# source: plugin name; t: when the beat happened (capture clock);
+# confidence: 0-1, the plugin's own certainty
+BeatCandidate = namedtuple("BeatCandidate", "source t downbeat confidence")
+# score: weighted confidence over the total detector weight; sources: plugin names
+FusedBeat = namedtuple("FusedBeat", "t downbeat measure beat score sources")
+
+
+# ================= SHARED FRAME PRODUCTS =================
+class FrameProducts:
+    """One captured frame and what detectors derive from it, each computed once"""
+
+    def __init__(self, frame, t, frame_id=None, tracer=NULL_TRACER):
+        self.frame = frame
+        self.t = t
+        self.frame_id = frame_id
+        self.tracer = tracer
+        self._cache = {}
+
+    def _get(self, name, compute):
+        if name not in self._cache:
+            start = time.perf_counter()
+            self._cache[name] = compute()
+            self.tracer.complete(name, start, time.perf_counter(), self.frame_id, cat="products")
+        return self._cache[name]
+
+    @property
+    def computed(self):
+        return tuple(self._cache)
+
+    @property
+    def gray(self):
+        return self._get("gray", lambda: cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def red_blob(self):
+        """Largest red blob in the full frame (segmentation.Blob), or None"""
+        return self._get("red_blob", lambda: default_segmenter().largest_blob(self.frame))
+
+
+# ================= PLUGINS =================
+class StrokeBottom:
+    """Holds a downbeat seen at the top of a stroke until the stroke's bottom.
+
+    arm(candidate) at the top, then update(y, t) every frame with the
+    hand's height (image y, downwards positive). Once the hand has come
+    back up by `rebound` px the candidate is returned, retimed to the
+    lowest point. Dropped if no bottom comes within `max_downstroke` s.
+    """
+
+    def __init__(self, rebound=STROKE_REBOUND, max_downstroke=MAX_DOWNSTROKE):
+        self.rebound = rebound
+        self.max_downstroke = max_downstroke
+        self.reset()
+
+    def reset(self):
+        self.candidate = None
+        self.low_y = self.low_t = None
+
+    def arm(self, candidate):
+        self.candidate = candidate
+        self.low_y = self.low_t = None
+
+    def update(self, y, t):
+        if self.candidate is None:
+            return None
+        if t - self.candidate.t > self.max_downstroke:
+            self.reset()
+            return None
+        if y is None:
+            return None
+        if self.low_y is None or y >= self.low_y:
+            self.low_y, self.low_t = y, t
+            return None
+        if self.low_y - y < self.rebound:
+            return None
+        candidate = self.candidate._replace(t=self.low_t)
+        self.reset()
+        return candidate
+
+
+class DetectorPlugin:
+    """A beat detector MultiDetector can run: process(products) -> [BeatCandidate].
+
+    `latency` (seconds) is how far the plugin's candidate times trail the
+    ictus; MultiDetector subtracts it before fusing.
+    """
+    name = "plugin"
+    latency = 0.0
+
+    def __init__(self, weight=1.0, latency=None):
+        self.weight = weight
+        if latency is not None:
+            self.latency = latency
+
+    def process(self, products):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+class ZonePlugin(DetectorPlugin):
+    """Red glove dropping into the bottom region: the measure detector's downbeat,
+    reported at the bottom of the stroke rather than the boundary crossing"""
+    name = "zone"
+    latency = 0.0
+
+    # Weighted double: it has by far the best downbeat precision on replays
+    def __init__(self, weight=2.0, latency=None, **detector_kwargs):
+        super().__init__(weight, latency)
+        # The shared blob replaces the detector's own ROI search
+        self.detector = DownbeatDetector(roi_tracking=False, **detector_kwargs)
+        self.stroke = StrokeBottom()
+
+    def process(self, products):
+        blob = products.red_blob
+        point = blob.bottommost if blob is not None else None
+        d = self.detector.process(products.frame, products.t, products.frame_id, point=point)
+        candidates = []
+        bottom = self.stroke.update(point[1] if point is not None else None, products.t)
+        if bottom is not None:
+            candidates.append(bottom)
+        if d.downbeat:
+            confidence = min(1.0, d.vy / ZONE_FULL_SPEED) if d.vy else 0.5
+            self.stroke.arm(BeatCandidate(self.name, d.downbeat_t, True, confidence))
+        return candidates
+
+    def reset(self):
+        self.detector.reset()
+        self.stroke.reset()
+
+
+class VelocityPlugin(DetectorPlugin):
+    """Velocity flips of the glove centre in the four-beat pattern (conductor_metronome.py).
+    Its downbeat is the top of the preparation stroke, so it is reported at
+    the bottom of the stroke that follows."""
+    name = "velocity"
+    latency = 0.0
+
+    def __init__(self, weight=1.0, latency=None, **detector_kwargs):
+        super().__init__(weight, latency)
+        self.detector = VelocityBeatDetector(**detector_kwargs)
+        self.stroke = StrokeBottom()
+
+    def process(self, products):
+        blob = products.red_blob
+        point = None
+        if blob is not None:
+            # Mirrored coordinates without flipping the frame
+            cx, cy = blob.centroid
+            point = (products.frame.shape[1] - 1 - cx, cy)
+        candidates = []
+        bottom = self.stroke.update(point[1] if point is not None else None, products.t)
+        if bottom is not None:
+            candidates.append(bottom)
+        beat = self.detector.update(point, products.t)
+        if beat is not None:
+            number, strength = beat
+            candidate = BeatCandidate(self.name, products.t, number == 1, min(1.0, strength / 2))
+            if candidate.downbeat:
+                self.stroke.arm(candidate)
+            else:
+                candidates.append(candidate)
+        return candidates
+
+    def reset(self):
+        self.detector = VelocityBeatDetector(self.detector.alpha, self.detector.debounce_time,
+                                             self.detector.vel_thresh)
+        self.stroke.reset()
+
+
+class BatonPlugin(DetectorPlugin):
+    """Relative extrema of a tracked box (yoloIdea.py). detect(frame) -> box or
+    None; by default the shared red blob's bounding box, so no model is needed.
+    Like VelocityPlugin, its downbeat (top of the stroke) is reported at the
+    bottom of the stroke that follows."""
+    name = "baton"
+    latency = 0.0
+
+    def __init__(self, detect=None, weight=1.0, latency=None, **tracker_kwargs):
+        super().__init__(weight, latency)
+        self.detect = detect
+        self.tracker_kwargs = tracker_kwargs
+        self._products = None
+        self.stroke = StrokeBottom()
+        self.reset()
+
+    def _detect(self, frame):
+        if self.detect is not None:
+            return self.detect(frame)
+        blob = self._products.red_blob
+        if blob is None:
+            return None
+        x, y, w, h = blob.bbox
+        return (float(x), float(y), float(x + w), float(y + h))
+
+    def process(self, products):
+        if self.beats is None:
+            self.beats = BeatCounter(products.frame.shape[1])
+        self._products = products
+        box = self.tracker.update(products.frame, products.gray)
+        self._products = None
+        candidates = []
+        bottom = self.stroke.update((box[1] + box[3]) / 2 if box is not None else None, products.t)
+        if bottom is not None:
+            candidates.append(bottom)
+        if box is None:
+            return candidates
+        event = self.beats.update(products.frame_id, box, products.t)
+        if event is not None:
+            kind, _, t = event
+            candidate = BeatCandidate(self.name, t, kind == "downbeat", 1.0)
+            if candidate.downbeat:
+                self.stroke.arm(candidate)
+            else:
+                candidates.append(candidate)
+        return candidates
+
+    def reset(self):
+        self.tracker = DetectThenTrack(self._detect, **self.tracker_kwargs)
+        self.beats = None
+        self.stroke.reset()
+
+
+# ================= FUSION =================
+class BeatFusion:
+    """Merges beat candidates from several detectors into one beat stream.
+
+    Candidates within `window` seconds of the first one in a group are the
+    same beat. A group closes when a later candidate falls outside it, or
+    on poll() once the window has passed. Each detector counts once per
+    group, with its most confident candidate; the group's score is the sum
+    of weight * confidence over the total weight of all detectors, and it
+    becomes a beat if the score reaches `threshold`. The beat's time is the
+    weighted mean of its candidates' times, and it is a downbeat when
+    downbeat votes carry at least half of its score.
+    """
+
+    def __init__(self, weights, window=FUSION_WINDOW, threshold=FUSION_THRESHOLD, first_measure=1):
+        self.weights = dict(weights)
+        self.total_weight = sum(self.weights.values()) or 1.0
+        self.window = window
+        self.threshold = threshold
+        self.measure = first_measure - 1
+        self.beat = 0
+        self.group = []
+        self.rejected = 0
+
+    def add(self, candidate):
+        """Add one candidate; returns the beats (0 or 1) of a group it closed"""
+        fused = []
+        if self.group and abs(candidate.t - self.group[0].t) > self.window:
+            fused = self._close()
+        self.group.append(candidate)
+        return fused
+
+    def poll(self, now):
+        """Close the open group if nothing can join it any more"""
+        if self.group and now - self.group[0].t > self.window:
+            return self._close()
+        return []
+
+    def _close(self):
+        group, self.group = self.group, []
+        best = {}
+        for c in group:
+            if c.source not in best or c.confidence > best[c.source].confidence:
+                best[c.source] = c
+        votes = [(self.weights.get(c.source, 1.0) * c.confidence, c) for c in best.values()]
+        support = sum(v for v, _ in votes)
+        score = support / self.total_weight
+        if support <= 0 or score < self.threshold:
+            self.rejected += 1
+            return []
+
+        t = float(sum(v * c.t for v, c in votes) / support)
+        downbeat = sum(v for v, c in votes if c.downbeat) >= support / 2
+        if downbeat:
+            self.measure += 1
+            self.beat = 1
+        else:
+            self.beat += 1
+        return [FusedBeat(t, downbeat, self.measure, self.beat, score,
+                          tuple(sorted(best)))]
+
+    def reset(self, first_measure=1):
+        self.measure = first_measure - 1
+        self.beat = 0
+        self.group = []
+        self.rejected = 0
+
+
+# ================= RUNNER =================
+class MultiDetector:
+    """Runs every plugin on each frame against one shared FrameProducts, then fuses.
+
+    share=False gives each plugin its own FrameProducts, which is what
+    running the detectors as separate pipelines costs.
+    """
+
+    def __init__(self, plugins, fusion=None, tracer=NULL_TRACER, share=True):
+        names = [p.name for p in plugins]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Plugin names must be unique, got {names}")
+        self.plugins = list(plugins)
+        self.fusion = fusion or BeatFusion({p.name: p.weight for p in plugins})
+        self.tracer = tracer
+        self.share = share
+        self.frames = 0
+
+    def process(self, frame, t, frame_id=None):
+        """(candidates, fused beats) for one frame captured at `t` seconds"""
+        self.frames += 1
+        if frame_id is None:
+            frame_id = self.frames
+        products = FrameProducts(frame, t, frame_id, self.tracer)
+        candidates = []
+        for plugin in self.plugins:
+            if not self.share:
+                products = FrameProducts(frame, t, frame_id, self.tracer)
+            start = time.perf_counter()
+            candidates.extend(c._replace(t=c.t - plugin.latency) for c in plugin.process(products))
+            self.tracer.complete(plugin.name, start, time.perf_counter(), frame_id, cat="detector")
+
+        fused = []
+        for candidate in sorted(candidates, key=lambda c: c.t):
+            fused.extend(self.fusion.add(candidate))
+        fused.extend(self.fusion.poll(t))
+        return candidates, fused
+
+    def reset(self):
+        for plugin in self.plugins:
+            plugin.reset()
+        self.fusion.reset()
+
+
+def make_plugins(names, baton_weights=None):
+    plugins = []
+    for name in names:
+        if name == "zone":
+            plugins.append(ZonePlugin())
+        elif name == "velocity":
+            plugins.append(VelocityPlugin())
+        elif name == "baton":
+            detect = None
+            if baton_weights:
+                from flowstate.bench_baton import yolo_detector
+                detect = yolo_detector(baton_weights)
+            plugins.append(BatonPlugin(detect))
+        else:
+            raise ValueError(f"Unknown detector {name!r}; expected one of {DETECTORS}")
+    return plugins
+
+# ================= CLI =================
+def main():
+    parser = argparse.ArgumentParser(description="Run several beat detectors on one capture and fuse them")
+    parser.add_argument("source", help="camera index, video file, image folder or .npy array of frames")
+    parser.add_argument("--fps", type=float, help="frame rate for image folders / arrays")
+    parser.add_argument("--detectors", default=",".join(DETECTORS),
+                        help=f"comma-separated, from {', '.join(DETECTORS)}")
+    parser.add_argument("--baton-weights", help="YOLO model for the baton detector (default: red blob box)")
+    parser.add_argument("--window", type=float, default=FUSION_WINDOW)
+    parser.add_argument("--threshold", type=float, default=FUSION_THRESHOLD)
+    parser.add_argument("--separate", action="store_true", help="no sharing: every detector derives its own images")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many frames")
+    parser.add_argument("--annotations", help="true downbeat times, one per line (seconds), as for replay_bench")
+    parser.add_argument("--offset", type=float, default=0.0, help="subtracted from every annotation")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    tracer = Tracer()
+    plugins = make_plugins([n for n in args.detectors.split(",") if n], args.baton_weights)
+    fusion = BeatFusion({p.name: p.weight for p in plugins}, args.window, args.threshold)
+    multi = MultiDetector(plugins, fusion, tracer, share=not args.separate)
+
+    candidates, fused = Counter(), []
+    downbeats = defaultdict(list)  # plugin name -> its own downbeat times
+    start = time.perf_counter()
+    with open_source(args.source, fps=args.fps) as source:
+        for frame_id, t, frame in source:
+            if args.limit is not None and multi.frames >= args.limit:
+                break
+            frame_candidates, frame_fused = multi.process(frame, t, frame_id)
+            candidates.update(c.source for c in frame_candidates)
+            for c in frame_candidates:
+                if c.downbeat:
+                    downbeats[c.source].append(c.t)
+            fused.extend(frame_fused)
+    wall = time.perf_counter() - start
+    if not multi.frames:
+        print("No frames read")
+        return
+
+    print(f"{multi.frames} frames in {wall:.2f} s ({multi.frames / wall:.0f} fps), "
+          f"{'separate' if args.separate else 'shared'} frame products")
+    times = stage_times(tracer)
+    for name, d in times.items():
+        print(f"  {name:>8}: {d.sum() / multi.frames * 1e3:6.2f} ms/frame over {len(d)} calls")
+    print("  (product time is also inside the detector that first asked for it)")
+    print("candidates: " + ", ".join(f"{p.name} {candidates[p.name]}" for p in plugins))
+    fused_downbeats = [b.t for b in fused if b.downbeat]
+    print(f"fused: {len(fused)} beats ({len(fused_downbeats)} downbeats), "
+          f"{fusion.rejected} groups below threshold")
+    if fused:
+        print(f"  mean score {np.mean([b.score for b in fused]):.2f}, "
+              f"agreed by 2+ detectors: {sum(len(b.sources) > 1 for b in fused)}")
+
+    if args.annotations:
+        annotated = np.atleast_1d(np.loadtxt(args.annotations)) - args.offset
+        print(f"downbeats vs {len(annotated)} annotated (offset = detected - annotated, after latency):")
+        rows = [(p.name, downbeats[p.name]) for p in plugins] + [("fused", fused_downbeats)]
+        for name, times in rows:
+            result = score(times, annotated, args.tolerance)
+            offset = f"{result['offset'] * 1e3:+4.0f} ms" if result["offset"] is not None else "n/a"
+            print(f"  {name:>8}: precision {result['precision']:.2f}  recall {result['recall']:.2f}  "
+                  f"offset {offset}")
+
+if __name__ == "__main__":
+    main()
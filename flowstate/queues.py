@@ -0,0 +1,90 @@
+import threading
+from collections import deque
+
+
+class DropOldestQueue:
+    """Bounded hand-off queue between pipeline stages.
+
+    put() never blocks: when the queue is full the oldest item is thrown
+    away, so a slow consumer always sees the freshest data instead of
+    falling further behind the producer.
+    """
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Pop the oldest item, or return None if nothing arrives in time"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LoopHandoff:
+    """Hand-off from any thread to an asyncio event loop.
+
+    put() queues an item and makes sure deliver(items) runs on the loop
+    with everything queued since its last run, in order. At most one
+    wake-up callback sits on the loop at a time however fast items are
+    put, so a busy producer cannot flood it. With maxsize the oldest
+    items are dropped first; maxsize=1 keeps only the newest.
+    """
+
+    def __init__(self, deliver, maxsize=None):
+        self.deliver = deliver
+        self.loop = None
+        self.dropped = 0
+        self._items = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    def bind(self, loop):
+        """Deliver on `loop` from now on; None stops delivery"""
+        self.loop = loop
+
+    def put(self, item):
+        """Queue an item from any thread; False if no loop is bound"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return False
+        with self._lock:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            if self._scheduled:
+                return True
+            self._scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._flush)
+        except RuntimeError:
+            # Loop closed while we were queueing; the server is shutting down
+            with self._lock:
+                self._scheduled = False
+        return True
+
+    def _flush(self):
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+            self._scheduled = False
+        self.deliver(items)
+
+    def __len__(self):
+        return len(self._items)
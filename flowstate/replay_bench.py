@@ -0,0 +1,133 @@
+"""Offline replay of the measure detector over a recording.
+
+    python -m flowstate.replay_bench rehearsal.mp4
+    python -m flowstate.replay_bench frames_dir/ --fps 30 --annotations downbeats.csv
+    python -m flowstate.replay_bench clip.npy --decisions out.csv
+
+Frames go through the same DownbeatDetector as the live server, as fast as
+they decode. Reports throughput and per-stage time, and with an annotation
+file (one downbeat time per line, seconds from the start of the recording)
+the precision / recall of the detected downbeats, scored on their
+interpolated crossing times.
+"""
+import argparse
+import time
+from collections import defaultdict
+import numpy as np
+
+from flowstate.downbeat_detector import (BOTTOM_REGION_HEIGHT, MIN_TIME_BETWEEN_CLICKS,
+                                         SMOOTHING_FRAMES, DownbeatDetector)
+from flowstate.frame_sources import open_source
+from flowstate.tracing import Tracer
+
+# ================= CONFIG =================
+TOLERANCE = 0.15  # seconds a detection may be off an annotated downbeat
+
+
+# ================= REPLAY =================
+def replay(source, detector, tracer, limit=None):
+    """Run every frame of `source` through `detector`; returns (decisions, wall time)"""
+    decisions = []
+    start = time.perf_counter()
+    frames = iter(source)
+    while limit is None or len(decisions) < limit:
+        read_start = time.perf_counter()
+        item = next(frames, None)
+        if item is None:
+            break
+        frame_id, t, frame = item
+        tracer.complete("read", read_start, time.perf_counter(), frame_id)
+        decisions.append(detector.process(frame, t, frame_id))
+    return decisions, time.perf_counter() - start
+
+def stage_times(tracer):
+    """{stage name: array of span durations in seconds}"""
+    durations = defaultdict(list)
+    for ph, name, _, _, dur, _, _ in tracer.events:
+        if ph == "X":
+            durations[name].append(dur)
+    return {name: np.array(d) for name, d in durations.items()}
+
+# ================= SCORING =================
+def match_downbeats(detected, annotated, tolerance=TOLERANCE):
+    """Pair detections with annotations one-to-one, in time order.
+
+    Returns the list of (detected, annotated) pairs within `tolerance`.
+    """
+    detected, annotated = sorted(detected), sorted(annotated)
+    pairs = []
+    i = j = 0
+    while i < len(detected) and j < len(annotated):
+        d, a = detected[i], annotated[j]
+        if abs(d - a) <= tolerance:
+            pairs.append((d, a))
+            i += 1
+            j += 1
+        elif d < a:
+            i += 1  # false positive
+        else:
+            j += 1  # missed downbeat
+    return pairs
+
+def score(detected, annotated, tolerance=TOLERANCE):
+    pairs = match_downbeats(detected, annotated, tolerance)
+    precision = len(pairs) / len(detected) if len(detected) else 0.0
+    recall = len(pairs) / len(annotated) if len(annotated) else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    offsets = np.array([d - a for d, a in pairs])
+    return {"precision": precision, "recall": recall, "f1": f1, "matched": len(pairs),
+            "offset": float(np.mean(offsets)) if len(offsets) else None}
+
+# ================= CLI =================
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recording through the measure detector")
+    parser.add_argument("source", help="video file, image folder or .npy array of frames")
+    parser.add_argument("--fps", type=float, help="frame rate for image folders / arrays, or to override a video's")
+    parser.add_argument("--annotations", help="true downbeat times, one per line (seconds)")
+    parser.add_argument("--offset", type=float, default=0.0,
+                        help="subtracted from every annotation, e.g. for absolute timestamps")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--bottom-region", type=int, default=BOTTOM_REGION_HEIGHT)
+    parser.add_argument("--smoothing", type=int, default=SMOOTHING_FRAMES)
+    parser.add_argument("--min-interval", type=float, default=MIN_TIME_BETWEEN_CLICKS)
+    parser.add_argument("--no-roi", action="store_true", help="segment the full frame every time")
+    parser.add_argument("--moving-average", action="store_true",
+                        help="smooth with the old moving average instead of the Kalman tracker")
+    parser.add_argument("--limit", type=int, help="stop after this many frames")
+    parser.add_argument("--decisions", help="write detected downbeats (frame_id,t,measure) to this CSV")
+    args = parser.parse_args()
+
+    tracer = Tracer()
+    detector = DownbeatDetector(bottom_region_height=args.bottom_region,
+                                min_time_between_clicks=args.min_interval,
+                                smoothing_frames=args.smoothing,
+                                roi_tracking=not args.no_roi,
+                                kinematic=not args.moving_average, tracer=tracer)
+    with open_source(args.source, fps=args.fps) as source:
+        decisions, wall = replay(source, detector, tracer, args.limit)
+    if not decisions:
+        print("No frames read")
+        return
+
+    downbeats = [d for d in decisions if d.downbeat]
+    print(f"{len(decisions)} frames in {wall:.2f} s ({len(decisions) / wall:.0f} fps), "
+          f"{len(downbeats)} downbeats")
+    for name, d in stage_times(tracer).items():
+        print(f"  {name:>8}: mean {d.mean() * 1e3:6.2f} ms  p95 {np.percentile(d, 95) * 1e3:6.2f} ms  "
+              f"max {d.max() * 1e3:6.2f} ms")
+
+    if args.decisions:
+        with open(args.decisions, "w") as f:
+            f.write("frame_id,t,measure\n")
+            for d in downbeats:
+                f.write(f"{d.frame_id},{d.downbeat_t:.4f},{d.measure_count}\n")
+
+    if args.annotations:
+        annotated = np.atleast_1d(np.loadtxt(args.annotations)) - args.offset
+        result = score([d.downbeat_t for d in downbeats], annotated, args.tolerance)
+        offset = f"{result['offset'] * 1e3:+.0f} ms" if result["offset"] is not None else "n/a"
+        print(f"vs {len(annotated)} annotated: precision {result['precision']:.2f}  "
+              f"recall {result['recall']:.2f}  F1 {result['f1']:.2f}  mean offset {offset}")
+
+if __name__ == "__main__":
+    main()
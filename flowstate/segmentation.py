@@ -0,0 +1,230 @@
+import threading
+import cv2
+import numpy as np
+from collections import deque, namedtuple
+from functools import lru_cache
+
+# ================= CONFIG =================
+# Red wraps around the hue axis, hence two (lower, upper) HSV ranges
+RED_RANGES = (
+    ((0, 120, 70), (10, 255, 255)),
+    ((170, 120, 70), (180, 255, 255)),
+)
+MIN_BLOB_AREA = 200
+MASK_DILATE = 5   # px square; what the old 5x5 blur did to the mask: joins a split glove
+
+Blob = namedtuple("Blob", ["area", "bbox", "centroid", "bottommost"])
+
+# ================= LOOKUP TABLE =================
+@lru_cache(maxsize=4)
+def compile_lut(ranges=RED_RANGES):
+    """BGR -> mask lookup table for a set of HSV ranges (16 MB, built once per process).
+
+    Indexed by B | G << 8 | R << 16, which is exactly how a BGRA pixel reads
+    as a little-endian uint32 once the alpha byte is masked off.
+    """
+    lut = np.empty((256, 256, 256), np.uint8)  # [R, G, B]
+    plane = np.empty((256, 256, 3), np.uint8)  # rows = G, cols = B
+    plane[:, :, 0] = np.arange(256, dtype=np.uint8)[None, :]
+    plane[:, :, 1] = np.arange(256, dtype=np.uint8)[:, None]
+    for r in range(256):
+        plane[:, :, 2] = r
+        hsv = cv2.cvtColor(plane, cv2.COLOR_BGR2HSV)
+        mask = lut[r]
+        mask[:] = 0
+        for lower, upper in ranges:
+            mask |= cv2.inRange(hsv, lower, upper)
+    lut = lut.reshape(-1)
+    lut.flags.writeable = False
+    return lut
+
+# ================= SEGMENTATION ENGINE =================
+class RedSegmenter:
+    """Single-pass colour segmentation + blob extraction.
+
+    One table lookup per pixel replaces cvtColor / inRange / OR, and
+    connected-component statistics replace findContours + convexHull. The
+    old blur before findContours grew the mask by two pixels, joining glove
+    fragments split by shading or fingers; a dilation over the mask's
+    bounding box does the same. Work buffers are reused between calls, so
+    keep one instance per thread.
+    """
+
+    def __init__(self, ranges=RED_RANGES, min_area=MIN_BLOB_AREA, dilate=MASK_DILATE):
+        self.lut = compile_lut(tuple(ranges))
+        self.min_area = min_area
+        self.kernel = np.ones((dilate, dilate), np.uint8) if dilate > 1 else None
+        self._bgra = np.empty(0, np.uint8)
+        self._idx = np.empty(0, np.intp)
+        self._mask = np.empty(0, np.uint8)
+
+    def _buffers(self, h, w):
+        n = h * w
+        if self._idx.size < n:
+            self._bgra = np.empty(n * 4, np.uint8)
+            self._idx = np.empty(n, np.intp)
+            self._mask = np.empty(n, np.uint8)
+        return (self._bgra[:n * 4].reshape(h, w, 4),
+                self._idx[:n].reshape(h, w),
+                self._mask[:n].reshape(h, w))
+
+    def mask(self, bgr):
+        """Binary (0/255) mask of in-range pixels. Valid until the next call."""
+        h, w = bgr.shape[:2]
+        bgra, idx, mask = self._buffers(h, w)
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA, dst=bgra)
+        # Index straight into intp so np.take does not convert it again
+        np.bitwise_and(bgra.view("<u4")[:, :, 0], 0xFFFFFF, out=idx)
+        np.take(self.lut, idx, out=mask, mode="clip")
+        return mask
+
+    def largest_blob(self, bgr, min_area=None):
+        """Largest 8-connected in-range blob, or None if it is below min_area"""
+        min_area = self.min_area if min_area is None else min_area
+        mask = self.mask(bgr)
+
+        # Dilate and label only the bounding box of the in-range pixels
+        ox, oy, bw, bh = cv2.boundingRect(mask)
+        if bw * bh <= min_area:
+            return None
+        box = mask[oy:oy + bh, ox:ox + bw]
+        if self.kernel is not None:
+            # Pad by the kernel radius so the blob can grow past the box
+            r = self.kernel.shape[0] // 2
+            x0, y0 = max(ox - r, 0), max(oy - r, 0)
+            x1, y1 = min(ox + bw + r, mask.shape[1]), min(oy + bh + r, mask.shape[0])
+            box = cv2.dilate(mask[y0:y1, x0:x1], self.kernel)
+            ox, oy = x0, y0
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(box, connectivity=8)
+        if n <= 1:
+            return None
+        label = 1 + int(stats[1:, cv2.CC_STAT_AREA].argmax())
+        x, y, w, h, area = stats[label]
+        if area <= min_area:
+            return None
+
+        # Bottommost point: middle of the blob's pixels on its lowest row
+        bottom = y + h - 1
+        xs = np.flatnonzero(labels[bottom, x:x + w] == label)
+        bottommost = (int(ox + x + xs[len(xs) // 2]), int(oy + bottom))
+        cx, cy = centroids[label]
+        return Blob(int(area), (int(ox + x), int(oy + y), int(w), int(h)),
+                    (float(ox + cx), float(oy + cy)), bottommost)
+
+    def bottommost(self, bgr, min_area=None):
+        blob = self.largest_blob(bgr, min_area)
+        return blob.bottommost if blob is not None else None
+
+_local = threading.local()
+
+def default_segmenter():
+    """Per-thread RedSegmenter sharing the process-wide lookup table"""
+    seg = getattr(_local, "segmenter", None)
+    if seg is None:
+        seg = _local.segmenter = RedSegmenter()
+    return seg
+
+def find_red_bottommost(bgr, min_area=MIN_BLOB_AREA):
+    """Bottommost point (x, y) of the largest red blob in a BGR image, or None"""
+    return default_segmenter().bottommost(bgr, min_area)
+
+# ================= ROI TRACKING =================
+class RoiTracker:
+    """Follows the red glove by segmenting only a window around its last position.
+
+    The window is centred on where the glove should be next (last point plus
+    last per-frame velocity) and grows with speed. When the glove is not found
+    in the window for `lost_after` frames, or the blob runs off the bottom of
+    the window, we fall back to a downscaled full-frame search followed by a
+    full-resolution pass around the coarse hit.
+    """
+
+    def __init__(self, min_half_size=60, velocity_gain=2.0, lost_after=2,
+                 fallback_scale=0.5, min_area=MIN_BLOB_AREA, segmenter=None):
+        self.segmenter = segmenter or RedSegmenter(min_area=min_area)
+        self.min_half_size = min_half_size
+        self.velocity_gain = velocity_gain
+        self.lost_after = lost_after
+        self.fallback_scale = fallback_scale
+        self.min_area = min_area
+
+        self.history = deque(maxlen=2)
+        self.misses = 0
+        self.roi_searches = 0
+        self.full_searches = 0
+        self.last_window = None
+
+    def reset(self):
+        self.history.clear()
+        self.misses = 0
+        self.last_window = None
+
+    def _velocity(self):
+        if len(self.history) < 2:
+            return 0, 0
+        (x0, y0), (x1, y1) = self.history
+        return x1 - x0, y1 - y0
+
+    def _window(self, shape, point, velocity=(0, 0)):
+        h, w = shape[:2]
+        x, y = point
+        vx, vy = velocity
+        cx, cy = x + vx, y + vy
+        half_w = int(self.min_half_size + self.velocity_gain * abs(vx))
+        half_h = int(self.min_half_size + self.velocity_gain * abs(vy))
+        x0, x1 = max(0, cx - half_w), min(w, cx + half_w)
+        y0, y1 = max(0, cy - half_h), min(h, cy + half_h)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+        return int(x0), int(y0), int(x1), int(y1)
+
+    def _search_window(self, frame, window):
+        x0, y0, x1, y1 = window
+        self.roi_searches += 1
+        point = self.segmenter.bottommost(frame[y0:y1, x0:x1], self.min_area)
+        if point is None:
+            return None, False
+        px, py = point[0] + x0, point[1] + y0
+        # Blob continues below the window: the real bottommost is further down
+        clipped = py >= y1 - 1 and y1 < frame.shape[0]
+        return (px, py), clipped
+
+    def _full_search(self, frame):
+        self.full_searches += 1
+        s = self.fallback_scale
+        small = cv2.resize(frame, None, fx=s, fy=s, interpolation=cv2.INTER_NEAREST)
+        coarse = self.segmenter.bottommost(small, self.min_area * s * s)
+        if coarse is None:
+            return None
+        # Refine at full resolution around the coarse hit
+        coarse = int(coarse[0] / s), int(coarse[1] / s)
+        window = self._window(frame.shape, coarse)
+        if window is None:
+            return coarse
+        point, _ = self._search_window(frame, window)
+        return point or coarse
+
+    def locate(self, frame):
+        """Bottommost point of the glove in this frame, or None if it is lost"""
+        point = None
+        if self.history:
+            window = self._window(frame.shape, self.history[-1], self._velocity())
+            self.last_window = window
+            if window is not None:
+                point, clipped = self._search_window(frame, window)
+                if clipped:
+                    point = None
+                    self.misses = self.lost_after
+            if point is None:
+                self.misses += 1
+                if self.misses >= self.lost_after:
+                    self.reset()
+
+        if point is None and not self.history:
+            self.last_window = None
+            point = self._full_search(frame)
+
+        if point is not None:
+            self.misses = 0
+            self.history.append(point)
+        return point
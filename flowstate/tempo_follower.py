@@ -0,0 +1,131 @@
+"""Tempo and meter following for tapped beats.
+
+Every tap is placed on the beat grid of the taps before it: an "other"
+tap is the nearest whole number of beats after the previous tap, a
+downbeat the nearest start of a measure. That gives one per-beat interval
+sample per tap, and the tempo is their median. The meter is the number of
+beats in measures where every beat was tapped, once two agree. Between
+taps the follower predicts the following beats, so the server can click
+them itself: tap every beat to set tempo and meter, then only downbeats
+(or any beat) to keep it in phase. A tap well off the current tempo
+starts a new one.
+"""
+from collections import deque
+import numpy as np
+
+# ================= CONFIG =================
+DEFAULT_METER = 4
+TEMPO_HISTORY = 4         # per-beat intervals in the tempo median
+MIN_PERIOD = 0.2          # s per beat (300 bpm)
+MAX_PERIOD = 2.0          # s per beat (30 bpm)
+TEMPO_CHANGE = 0.15       # relative period change that drops the older intervals
+TIMEOUT_MEASURES = 2      # measures filled in after the last tap before stopping
+
+
+class TempoFollower:
+    def __init__(self, meter=DEFAULT_METER, history=TEMPO_HISTORY, min_period=MIN_PERIOD,
+                 max_period=MAX_PERIOD, tempo_change=TEMPO_CHANGE, timeout_measures=TIMEOUT_MEASURES):
+        self.meter = meter
+        self.min_period = min_period
+        self.max_period = max_period
+        self.tempo_change = tempo_change
+        self.timeout_measures = timeout_measures
+        self.intervals = deque(maxlen=history)
+        self.measure_lengths = deque(maxlen=2)
+        self.reset()
+
+    def reset(self):
+        self.intervals.clear()
+        self.measure_lengths.clear()
+        self.period = None
+        self.anchor_t = None
+        self.anchor_beat = None      # beat number (1 = downbeat) of the last tap
+        self.next_k = 1              # next beat after the anchor still to predict
+        self.beats_in_measure = None  # beats since the last downbeat tap, None before one
+        self.measure_complete = False  # every beat since that downbeat was tapped
+        self.taps = 0
+
+    # ---------------- TAPS ----------------
+    def _beats_since_anchor(self, gap, downbeat):
+        """Whole beats between the anchor and a tap `gap` seconds later"""
+        if self.period is None:
+            if downbeat and self.anchor_beat == 1:
+                return self.meter  # downbeats only so far: assume whole measures
+            return 1
+        k = max(1, int(round(gap / self.period)))
+        if downbeat and k > 1:
+            # Beats between were not tapped, so the tap belongs on a measure
+            # start: first, first + meter, ... beats on. (A downbeat on the very
+            # next beat is taken as it is: the measure was short.)
+            first = self.meter - self.anchor_beat + 1
+            measures = max(0, int(round((k - first) / self.meter)))
+            k = first + measures * self.meter
+        return k
+
+    def tap(self, t, downbeat):
+        """A tapped beat at time t; returns its beat number (1 = downbeat)"""
+        k = None
+        if self.anchor_t is not None and t > self.anchor_t:
+            gap = t - self.anchor_t
+            k = self._beats_since_anchor(gap, downbeat)
+            per_beat = gap / k
+            if self.min_period <= per_beat <= self.max_period:
+                if self.period is not None and abs(per_beat - self.period) > self.tempo_change * self.period:
+                    self.intervals.clear()  # new tempo: the old intervals only drag it back
+                self.intervals.append(per_beat)
+                self.period = float(np.median(self.intervals))
+            elif per_beat > self.max_period:
+                # A pause: keep the tempo, but the grid is lost
+                k = None
+
+        if downbeat:
+            if self.beats_in_measure is not None and self.measure_complete and k is not None:
+                self.measure_lengths.append(self.beats_in_measure + k)
+                # A new meter counts once two fully tapped measures agree on it
+                if len(self.measure_lengths) == 1 or self.measure_lengths[-1] == self.measure_lengths[-2]:
+                    self.meter = self.measure_lengths[-1]
+            number = 1
+            self.beats_in_measure = 0
+            self.measure_complete = True
+        else:
+            if k is None:
+                number = self.anchor_beat % self.meter + 1 if self.anchor_beat else 2
+            else:
+                number = (self.anchor_beat - 1 + k) % self.meter + 1
+            if self.beats_in_measure is not None:
+                self.beats_in_measure += k or 1
+                self.measure_complete = self.measure_complete and k == 1
+
+        self.anchor_t = t
+        self.anchor_beat = number
+        self.next_k = 1
+        self.taps += 1
+        return number
+
+    # ---------------- PREDICTION ----------------
+    @property
+    def bpm(self):
+        return 60.0 / self.period if self.period else None
+
+    @property
+    def following(self):
+        return self.period is not None and self.anchor_t is not None
+
+    def beats_until(self, horizon):
+        """Predicted beats up to time `horizon` not returned before: [(t, downbeat)]"""
+        if not self.following:
+            return []
+        beats = []
+        last_k = self.timeout_measures * self.meter
+        while self.next_k <= last_k:
+            t = self.anchor_t + self.next_k * self.period
+            if t > horizon:
+                break
+            number = (self.anchor_beat - 1 + self.next_k) % self.meter + 1
+            beats.append((t, number == 1))
+            self.next_k += 1
+        return beats
+
+    def state(self):
+        return {"bpm": round(self.bpm, 1) if self.bpm else None, "meter": self.meter,
+                "following": self.following, "taps": self.taps}
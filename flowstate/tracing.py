@@ -0,0 +1,95 @@
+"""Span tracing for the beat path, exported as a Chrome / Perfetto trace.
+
+Stages record (name, start, end) in time.perf_counter() seconds, tagged
+with the frame id they belong to. Events go into a bounded deque (append
+is atomic, so producers never lock). dump() writes the Trace Event JSON
+that chrome://tracing and ui.perfetto.dev open directly.
+
+The servers only trace on demand: set FLOWSTATE_TRACE=1 in the environment
+to record.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# ================= CONFIG =================
+MAX_EVENTS = 200_000
+TRACE_ENABLED = os.environ.get("FLOWSTATE_TRACE", "") not in ("", "0")
+
+
+class Tracer:
+    def __init__(self, max_events=MAX_EVENTS, enabled=True):
+        self.enabled = enabled
+        self.events = deque(maxlen=max_events)
+        self.threads = {}
+        self.pid = os.getpid()
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        return tid
+
+    # ---------------- RECORDING ----------------
+    def complete(self, name, start, end, frame_id=None, cat="pipeline", **args):
+        """A finished span from `start` to `end` (perf_counter seconds)"""
+        if not self.enabled:
+            return
+        if frame_id is not None:
+            args["frame_id"] = frame_id
+        self.events.append(("X", name, cat, start, end - start, self._tid(), args))
+
+    def instant(self, name, ts=None, frame_id=None, cat="pipeline", **args):
+        if not self.enabled:
+            return
+        if frame_id is not None:
+            args["frame_id"] = frame_id
+        ts = time.perf_counter() if ts is None else ts
+        self.events.append(("i", name, cat, ts, 0.0, self._tid(), args))
+
+    @contextmanager
+    def span(self, name, frame_id=None, cat="pipeline", **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, time.perf_counter(), frame_id, cat, **args)
+
+    def extend(self, events, thread_name=None):
+        """Add events recorded by another Tracer, e.g. in a worker process"""
+        if not self.enabled:
+            return
+        for event in events:
+            if thread_name is not None:
+                self.threads.setdefault(event[5], thread_name)
+            self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
+
+    # ---------------- EXPORT ----------------
+    def to_chrome(self):
+        trace = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                  "args": {"name": name}} for tid, name in list(self.threads.items())]
+        for ph, name, cat, ts, dur, tid, args in list(self.events):
+            event = {"name": name, "cat": cat, "ph": ph, "pid": self.pid, "tid": tid,
+                     "ts": ts * 1e6, "args": args}
+            if ph == "X":
+                event["dur"] = dur * 1e6
+            else:
+                event["s"] = "t"
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+        return path
+
+
+# Disabled stand-in so call sites never need "if tracer:"
+NULL_TRACER = Tracer(max_events=1, enabled=False)
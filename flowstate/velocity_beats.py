@@ -0,0 +1,94 @@
+"""Velocity-extremum beat detection for a four-beat conducting pattern.
+
+The hand's position is low-pass filtered and differentiated; each beat of
+the pattern (down, left, right, up) is the moment the velocity along its
+axis flips sign with at least VEL_THRESH px/s on both sides. Beats must
+come in pattern order and at least DEBOUNCE_TIME apart. Coordinates are
+those of the mirrored (selfie) view, as the conductor sees themselves.
+"""
+import numpy as np
+
+# ================= CONFIG =================
+ALPHA = 0.3             # Low-pass filter smoothing
+DEBOUNCE_TIME = 0.4     # Seconds between beats
+VEL_THRESH = 18         # Minimum velocity to consider a beat
+BEAT_NAMES = ("Downbeat", "Left", "Right", "Upbeat")
+
+
+class LowPassFilter:
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.state = None
+    def filter(self, value):
+        if self.state is None:
+            self.state = value
+        else:
+            self.state = self.alpha * value + (1 - self.alpha) * self.state
+        return self.state
+
+
+class BeatStateMachine:
+    def __init__(self):
+        self.state = 0  # 0: down, 1: left, 2: right, 3: up
+    def next(self):
+        self.state = (self.state + 1) % 4
+    def get_expected(self):
+        return self.state
+
+
+class VelocityBeatDetector:
+    def __init__(self, alpha=ALPHA, debounce_time=DEBOUNCE_TIME, vel_thresh=VEL_THRESH):
+        self.alpha = alpha
+        self.debounce_time = debounce_time
+        self.vel_thresh = vel_thresh
+        self.beat_machine = BeatStateMachine()
+        self.last_trigger_time = None
+        self.reset()
+
+    def reset(self):
+        """Forget the hand (it left the frame); the pattern position is kept"""
+        self.filter_x, self.filter_y = LowPassFilter(self.alpha), LowPassFilter(self.alpha)
+        self.prev_pos = self.prev_time = None
+        self.prev_vel = np.zeros(2)
+        self.vel = np.zeros(2)
+        self.pos = None
+
+    def _flip(self, expected, prev_vel, vel):
+        """True when the velocity turned the way beat `expected` needs"""
+        th = self.vel_thresh
+        if expected == 0:
+            return prev_vel[1] < -th and vel[1] > th
+        if expected == 1:
+            return prev_vel[0] > th and vel[0] < -th
+        if expected == 2:
+            return prev_vel[0] < -th and vel[0] > th
+        return prev_vel[1] > th and vel[1] < -th
+
+    def update(self, point, t):
+        """Feed the hand centre at time `t` (None when not found).
+
+        Returns (beat number 1-4, strength) when this frame completes the
+        expected beat, else None. Strength is the smaller of the two speeds
+        around the flip, in multiples of the threshold.
+        """
+        if point is None:
+            self.reset()
+            return None
+        self.pos = np.array([self.filter_x.filter(point[0]), self.filter_y.filter(point[1])])
+        self.vel = np.zeros(2)
+        beat = None
+        if self.prev_pos is not None:
+            dt = t - self.prev_time
+            if dt > 0:
+                self.vel = (self.pos - self.prev_pos) / dt
+            expected = self.beat_machine.get_expected()
+            axis = 1 if expected in (0, 3) else 0
+            if self._flip(expected, self.prev_vel, self.vel) and (
+                    self.last_trigger_time is None or t - self.last_trigger_time > self.debounce_time):
+                strength = min(abs(self.prev_vel[axis]), abs(self.vel[axis])) / self.vel_thresh
+                beat = (expected + 1, float(strength))
+                self.beat_machine.next()
+                self.last_trigger_time = t
+            self.prev_vel = self.vel
+        self.prev_pos, self.prev_time = self.pos, t
+        return beat
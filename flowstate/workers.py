@@ -0,0 +1,261 @@
+"""Downbeat detection in worker processes, fed through shared memory.
+
+The detection loop is mostly Python glue around OpenCV / NumPy calls, so
+run as a thread it competes for the GIL with the asyncio loop serving the
+WebSockets. A DetectionWorker runs DownbeatDetector in its own process
+instead. Frames are copied into a shared-memory ring, and only small
+(seq, frame_id, t) notices and Decisions cross the pipe. One worker per
+camera spreads the sessions across cores.
+
+    python -m flowstate.workers rehearsal.mp4 --workers 4
+
+replays a recording through several workers at once and reports throughput.
+"""
+import argparse
+import itertools
+import multiprocessing as mp
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from flowstate.downbeat_detector import DownbeatDetector
+from flowstate.tracing import NULL_TRACER, Tracer
+
+# ================= CONFIG =================
+RING_SLOTS = 4
+RESULT_TIMEOUT = 2.0     # seconds to wait for one frame's decision
+STARTUP_TIMEOUT = 30.0   # for a new worker to import cv2 and say it is ready
+
+
+class FrameRing:
+    """Fixed ring of equally sized frames in shared memory.
+
+    The header holds the sequence number of the frame in each slot. A
+    reader copies a slot out and checks the number again afterwards, so a
+    frame overwritten mid-copy is dropped instead of being read torn.
+    """
+
+    def __init__(self, shape, slots=RING_SLOTS, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = -(-8 * slots // 64) * 64
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * frame_bytes)
+        else:
+            # Workers are spawned, so they share the creator's resource
+            # tracker and attaching does not hand them ownership
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.seqs = np.ndarray((slots,), np.int64, self.shm.buf, 0)
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, self.shm.buf, header_bytes)
+        if self.owner:
+            self.seqs.fill(-1)
+
+    def write(self, seq, frame):
+        slot = seq % self.slots
+        self.seqs[slot] = -1  # being written
+        np.copyto(self.frames[slot], frame)
+        self.seqs[slot] = seq
+
+    def read(self, seq, out):
+        """Copy frame `seq` into `out`; False if it was overwritten"""
+        slot = seq % self.slots
+        if self.seqs[slot] != seq:
+            return False
+        np.copyto(out, self.frames[slot])
+        return self.seqs[slot] == seq
+
+    def close(self):
+        del self.seqs, self.frames  # views must go before the mapping
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ================= WORKER PROCESS =================
+def _worker_main(conn, slots, detector_kwargs, trace):
+    tracer = Tracer(enabled=trace)
+    detector = DownbeatDetector(tracer=tracer, **detector_kwargs)
+    ring = frame = None
+    skipped = 0
+    conn.send(("ready",))
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                return
+            if msg[0] == "reset":
+                detector.reset()
+                continue
+            if msg[0] == "ring":
+                # The ring comes with the first frame, once its shape is known
+                _, ring_name, shape = msg
+                ring = FrameRing(shape, slots, name=ring_name)
+                frame = np.empty(shape, np.uint8)
+                continue
+            # Only the newest frame matters; drop notices that piled up meanwhile
+            while conn.poll():
+                newer = conn.recv()
+                if newer is None:
+                    return
+                if newer[0] == "reset":
+                    detector.reset()
+                    continue
+                skipped += 1
+                msg = newer
+            _, seq, frame_id, t = msg
+            if not ring.read(seq, frame):
+                conn.send(("overwritten", frame_id, skipped))
+                continue
+            decision = detector.process(frame, t, frame_id)
+            conn.send(("decision", decision, list(tracer.events), skipped))
+            tracer.clear()
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if ring is not None:
+            ring.close()
+
+
+# ================= PARENT SIDE =================
+class DetectionWorker:
+    """A DownbeatDetector in its own process.
+
+    start() spawns the process and waits until it is ready, so call it
+    before frames start arriving; otherwise the first frame starts it.
+    process() is a drop-in for DownbeatDetector.process(): it copies one
+    frame into the ring and waits for the decision. The waiting thread sleeps in a pipe
+    read with the GIL released. submit() / result() split the two halves.
+    """
+
+    def __init__(self, slots=RING_SLOTS, tracer=NULL_TRACER, name="detect worker", **detector_kwargs):
+        self.slots = slots
+        self.tracer = tracer
+        self.name = name
+        self.detector_kwargs = detector_kwargs
+        self.ring = None
+        self.proc = None
+        self.conn = None
+        self._seq = itertools.count()
+        self.skipped = 0
+        self.overwritten = 0
+
+    def start(self, timeout=STARTUP_TIMEOUT):
+        """Spawn the worker and block until it has imported everything and built its detector"""
+        ctx = mp.get_context("spawn")  # never fork a process that has audio and camera threads
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, name=self.name, daemon=True,
+                                args=(child_conn, self.slots, self.detector_kwargs, self.tracer.enabled))
+        self.proc.start()
+        child_conn.close()
+        if not self.conn.poll(timeout):
+            self.close()
+            raise RuntimeError(f"{self.name} was not ready after {timeout:.0f} s")
+        try:
+            self.conn.recv()
+        except EOFError:
+            exitcode = self.proc.exitcode
+            self.close()
+            raise RuntimeError(f"{self.name} exited during start-up with code {exitcode}") from None
+
+    def submit(self, frame_id, t, frame):
+        if self.proc is None:
+            self.start()
+        if self.ring is None:
+            self.ring = FrameRing(frame.shape, self.slots)
+            self.conn.send(("ring", self.ring.name, self.ring.shape))
+        elif frame.shape != self.ring.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the ring's {self.ring.shape}")
+        seq = next(self._seq)
+        self.ring.write(seq, frame)
+        self.conn.send(("frame", seq, frame_id, t))
+
+    def result(self, timeout=RESULT_TIMEOUT):
+        """Next Decision from the worker, or None on timeout or a dropped frame"""
+        if not self.conn.poll(timeout):
+            if not self.proc.is_alive():
+                raise RuntimeError(f"{self.name} exited with code {self.proc.exitcode}")
+            return None
+        msg = self.conn.recv()
+        if msg[0] == "overwritten":
+            _, _, self.skipped = msg
+            self.overwritten += 1
+            return None
+        _, decision, events, self.skipped = msg
+        self.tracer.extend(events, f"{self.name} ({self.proc.pid})")
+        return decision
+
+    def process(self, frame, t, frame_id=None, timeout=RESULT_TIMEOUT):
+        self.submit(frame_id, t, frame)
+        while True:
+            decision = self.result(timeout)
+            if decision is None or decision.frame_id == frame_id:
+                return decision
+
+    def reset(self):
+        if self.conn is not None:
+            self.conn.send(("reset",))
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.proc.join(timeout=2.0)
+            if self.proc.is_alive():
+                self.proc.terminate()
+                self.proc.join()
+            self.conn.close()
+            self.proc = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ================= CLI =================
+def main():
+    from flowstate.frame_sources import open_source
+
+    parser = argparse.ArgumentParser(description="Replay a recording through several detection workers at once")
+    parser.add_argument("source", help="video file, image folder or .npy array of frames")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--fps", type=float)
+    parser.add_argument("--limit", type=int, default=300)
+    args = parser.parse_args()
+
+    with open_source(args.source, fps=args.fps) as source:
+        frames = [(frame_id, t, frame) for frame_id, t, frame in itertools.islice(source, args.limit)]
+    if not frames:
+        print("No frames read")
+        return
+
+    counts = [0] * args.workers
+    def feed(index):
+        with DetectionWorker(name=f"worker {index}") as worker:
+            worker.start()
+            start = time.perf_counter()
+            for frame_id, t, frame in frames:
+                if worker.process(frame, t, frame_id) is not None:
+                    counts[index] += 1
+            counts[index] /= time.perf_counter() - start
+
+    threads = [threading.Thread(target=feed, args=(i,)) for i in range(args.workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"{args.workers} workers x {len(frames)} frames: "
+          + ", ".join(f"{fps:.0f}" for fps in counts) + f" fps, {sum(counts):.0f} fps total")
+
+if __name__ == "__main__":
+    main()
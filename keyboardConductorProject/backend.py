@@ -1,42 +1,51 @@
+import itertools
+import json
+from collections import deque
+from contextlib import asynccontextmanager
 import os
-import threading
+import sys
 import time
 import numpy as np
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from scipy.io import wavfile
-import sounddevice as sd
 import uvicorn
 import asyncio
 
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flowstate.broadcaster import Broadcaster
+from flowstate.clock_sync import SYNC_BURST, SYNC_BURST_INTERVAL, SYNC_INTERVAL, ClockSync
+from flowstate.measure_synth import open_measure_audio, wav_bytes
+from flowstate.mixer import Mixer
+from flowstate.tempo_follower import TempoFollower
+
 # ================= CONFIG =================
 FS = 44100
 BLOCKSIZE = 256
 BASE_DIR = os.path.dirname(__file__)
 MEASURE_FOLDER = os.path.join(BASE_DIR, "measure_wavs")
 FRONTEND_FILE = os.path.join(BASE_DIR, "index.html")
+BEAT_DELAY = 0.08   # s from key press to click for WebSocket beats; covers network jitter
+TEMPO_FOLLOW = True  # click the beats between taps at the tapped tempo
+FILL_LOOKAHEAD = 0.15  # s; filled-in beats are queued on the mixer this far ahead
+FILL_TICK = 0.02
+FILL_MATCH = 0.35   # fraction of a beat a tap may miss a filled-in beat by and still be that beat
+SERVER_AUDIO = True  # also click on this machine; off when everyone listens on their own device
+CLIENT_BUFFER = 0.06  # s pages render a beat after its server time, so late messages still land
 
 # ================= STATE =================
-active_sounds = []
-audio_lock = threading.Lock()
-measure_audio = {}
 beat = 0
 measure = 1
+late_beats = 0   # WebSocket beats that arrived after their click time
+beat_ids = itertools.count(1)
+last_beat = None  # the latest published beat message
 
 # ================= LOAD MEASURE WAVS =================
-for file_name in os.listdir(MEASURE_FOLDER):
-    if file_name.startswith("measure_") and file_name.endswith(".wav"):
-        measure_num = int(file_name.split("_")[1].split(".")[0])
-        path = os.path.join(MEASURE_FOLDER, file_name)
-        fs_data, data = wavfile.read(path)
-        if data.dtype == np.int16:
-            data = data.astype(np.float32) / 32768.0
-        # Convert stereo to mono if necessary
-        if data.ndim > 1:
-            data = data[:,0]
-        measure_audio[measure_num] = data
-print(f"Loaded measure audio files: {list(measure_audio.keys())}")
+# Shared memory-mapped bank of cues prepared for FS, built from measure_wavs on
+# first run; measures it lacks are spliced from the word bank in measure_words/
+measure_audio = open_measure_audio(MEASURE_FOLDER, sample_rate=FS)
+print(f"Measure announcements: {measure_audio.describe()}")
 
 # ================= CLICK SOUNDS =================
 def generate_click(freq, ms, amp=0.6):
@@ -46,39 +55,30 @@ def generate_click(freq, ms, amp=0.6):
 click_downbeat = generate_click(1500, 25)
 click_other = generate_click(1000, 15)
 
-# ================= AUDIO CALLBACK =================
-def audio_callback(outdata, frames, time_info, status):
-    outdata[:] = 0
-    with audio_lock:
-        finished = []
-        for i, sound in enumerate(active_sounds):
-            data, pos = sound
-            n = min(len(data)-pos, frames)
-            outdata[:n, 0] += data[pos:pos+n]
-            sound[1] += n
-            if sound[1] >= len(data):
-                finished.append(i)
-        for i in reversed(finished):
-            active_sounds.pop(i)
-
-def play(sound):
-    with audio_lock:
-        active_sounds.append([sound, 0])
+# ================= AUDIO =================
+mixer = Mixer(fs=FS, blocksize=BLOCKSIZE)
+
+def play(sound, at=None):
+    if not SERVER_AUDIO:
+        return None
+    return mixer.play(sound, at=at)
 
 # ================= START AUDIO STREAM =================
 def start_audio_stream():
-    sd.OutputStream(
-        samplerate=FS,
-        channels=1,
-        blocksize=BLOCKSIZE,
-        callback=audio_callback
-    ).start()
+    mixer.start()
     print("Audio stream started")
 
-threading.Thread(target=start_audio_stream, daemon=True).start()
+start_audio_stream()
 
 # ================= FASTAPI =================
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    filler = asyncio.create_task(fill_loop()) if TEMPO_FOLLOW else None
+    yield
+    if filler is not None:
+        filler.cancel()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -86,69 +86,232 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-clients = set()
+broadcaster = Broadcaster()   # one sender task per client, beats always delivered in order
 
-async def broadcast_state():
-    to_remove = set()
-    for ws in clients:
-        try:
-            await ws.send_json({
-                "measure": measure,
-                "beat": beat,
-                "timestamp": time.time()
-            })
-        except:
-            to_remove.add(ws)
-    for ws in to_remove:
-        clients.remove(ws)
+def broadcast_state(at=None, announce=None):
+    """Publish a beat's schedule entry: measure, beat and its click time `at`
+    on the server clock, which pages with local audio render themselves"""
+    global last_beat
+    at = time.perf_counter() if at is None else at
+    last_beat = {
+        "type": "beat",
+        "id": next(beat_ids),
+        "measure": measure,
+        "beat": beat,
+        "t": at,
+        "announce": announce,
+        # Wall-clock time of the beat itself, so the page's BPM ignores network delay
+        "timestamp": time.time() - (time.perf_counter() - at)
+    }
+    broadcaster.publish_event(last_beat)
+
+def move_beat(message, at):
+    """Republish an already published beat at a new time; pages drop the old one"""
+    moved = dict(message, id=next(beat_ids), replaces=message["id"], t=at,
+                 timestamp=time.time() - (time.perf_counter() - at))
+    broadcaster.publish_event(moved)
+    return moved
+
+def cancel_beat(message):
+    """Tell pages to drop a published beat they have not played yet"""
+    broadcaster.publish_event({"type": "cancel", "id": message["id"]})
 
 # ================= FRONTEND =================
 @app.get("/")
 def get_frontend():
     return FileResponse(FRONTEND_FILE)
 
+@app.get("/measures/{number}")
+def get_measure_audio(number: int):
+    """Measure announcement for pages that render audio locally"""
+    path = os.path.join(MEASURE_FOLDER, f"measure_{number}.wav")
+    if os.path.exists(path):
+        return FileResponse(path, media_type="audio/wav")
+    if number not in measure_audio:
+        raise HTTPException(status_code=404, detail=f"No announcement for measure {number}")
+    return Response(wav_bytes(measure_audio[number], FS), media_type="audio/wav")
+
 # ================= WEBSOCKET =================
+# Besides state updates, the socket carries beats from the page stamped
+# with the key press time on the client's clock, and periodic pings that
+# keep a per-client ClockSync estimate of that clock's offset. A beat is
+# clicked at its press time on the server clock plus BEAT_DELAY, so
+# network jitter below BEAT_DELAY does not move the click.
+#
+# The same estimate goes back to each page after every ping, so a page can
+# render the beat schedule with Web Audio on its own device: every beat at
+# its server time plus CLIENT_BUFFER, converted to the page's clock. All
+# pages hear the beat at the same moment, without any audio streamed.
+clock_syncs = {}   # ws -> ClockSync
+
+async def ping_loop(ws):
+    for i in itertools.count():
+        broadcaster.send_to(ws, {"type": "ping", "t0": time.perf_counter()})
+        await asyncio.sleep(SYNC_BURST_INTERVAL if i < SYNC_BURST else SYNC_INTERVAL)
+
+def beat_time(sync, t_client):
+    """Server perf_counter() time to click a beat pressed at client time t_client"""
+    global late_beats
+    now = time.perf_counter()
+    if t_client is None or not sync.synced:
+        return now + BEAT_DELAY
+    due = sync.to_server(t_client) + BEAT_DELAY
+    if due < now:
+        late_beats += 1
+    return due
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
-    clients.add(ws)
+    broadcaster.add(ws)
+    sync = clock_syncs[ws] = ClockSync()
+    broadcaster.send_to(ws, {"type": "hello", "buffer": CLIENT_BUFFER})
+    pinger = asyncio.create_task(ping_loop(ws))
     try:
         while True:
-            await ws.receive_text()  # keep connection alive
-    except:
+            message = json.loads(await ws.receive_text())
+            kind = message.get("type")
+            if kind == "pong":
+                sync.add(message["t0"], message["t1"], time.perf_counter())
+                broadcaster.send_to(ws, {"type": "clock", "offset": sync.offset, "rtt": sync.rtt})
+            elif kind == "beat":
+                at = beat_time(sync, message.get("t"))
+                tap(message.get("beat") == "downbeat", at)
+    except (WebSocketDisconnect, ValueError, KeyError):
         pass
     finally:
-        clients.remove(ws)
+        pinger.cancel()
+        clock_syncs.pop(ws, None)
+        broadcaster.remove(ws)
 
-# ================= BEAT ENDPOINTS =================
-@app.post("/beat/downbeat")
-async def downbeat():
+@app.get("/clients")
+def get_clients():
+    """Clock offset / round trip per connected client"""
+    return {"beat_delay": BEAT_DELAY, "late_beats": late_beats,
+            "clients": [s.stats() for s in clock_syncs.values()]}
+
+# ================= BEATS =================
+def downbeat_at(at=None):
+    """Click a downbeat and start the next measure; returns the [(sound, voice id)] queued"""
     global beat, measure
-    play(click_downbeat)
+    voices = [(click_downbeat, play(click_downbeat, at=at))]
     beat = 1
 
     # Play measure audio every 4 measures: 1,5,9,...
-    if (measure) % 4 == 0 and measure in measure_audio:
-        play(measure_audio[measure + 1])
+    announce = None
+    if (measure) % 4 == 0 and measure + 1 in measure_audio:
+        announce = measure + 1
+        sound = measure_audio[announce]
+        voices.append((sound, play(sound, at=at)))
         print(f"Playing measure audio for measure {measure}")
 
     # Broadcast current state
-    asyncio.create_task(broadcast_state())
+    broadcast_state(at, announce)
 
     # Increment measure after broadcasting
     measure += 1
-    return {"status": "ok"}
+    return voices
 
-@app.post("/beat/other")
-async def other_beat():
+def other_beat_at(at=None):
+    """Click the next beat of the measure; None before the first downbeat"""
     global beat
     if beat == 0:
-        return {"status": "ignored"}
-    play(click_other)
+        return None
+    voices = [(click_other, play(click_other, at=at))]
     beat += 1
-    asyncio.create_task(broadcast_state())
+    broadcast_state(at)
+    return voices
+
+# ================= TEMPO FOLLOWING =================
+# The TempoFollower learns tempo and meter from the taps, and fill_loop
+# clicks the beats in between itself: each predicted beat is queued on
+# the mixer FILL_LOOKAHEAD before it is due, so it is sample-accurate and
+# never waits on the network. A tap on a beat that already has a fill
+# takes the fill's place if it has not started playing (the conductor's
+# timing wins) and otherwise only re-anchors the follower. A tap of the
+# other kind (downbeat vs. other beat) undoes the fill: its sound, its
+# step of the measure/beat counters and its entry in the pages' schedule.
+follower = TempoFollower()
+fills = deque()   # (t, downbeat, [(sound, voice id)], beat message, (measure, beat) before it)
+
+async def fill_loop():
+    while True:
+        try:
+            for t, downbeat in follower.beats_until(time.perf_counter() + FILL_LOOKAHEAD):
+                counters = (measure, beat)
+                voices = downbeat_at(t) if downbeat else other_beat_at(t)
+                if voices:
+                    fills.append((t, downbeat, voices, last_beat, counters))
+        except Exception as e:
+            # One bad beat must not end tempo following for the session
+            print(f"Fill loop error: {e!r}")
+        await asyncio.sleep(FILL_TICK)
+
+def undo_fills(first):
+    """Drop the fill `first` and every fill after it, rolling the counters back"""
+    global measure, beat
+    now = time.perf_counter()
+    dropped = list(fills)[list(fills).index(first):]
+    for fill in reversed(dropped):
+        fill_t, _, voices, message, counters = fill
+        fills.remove(fill)
+        if fill_t > now:
+            for _, voice_id in voices:
+                mixer.cancel(voice_id)
+        cancel_beat(message)
+        measure, beat = counters
+
+def take_fill(t, downbeat):
+    """Remove and return the filled-in beat a tap at `t` lands on, if any"""
+    now = time.perf_counter()
+    while fills and fills[0][0] < now - 1.0:
+        fills.popleft()
+    if not follower.period:
+        return None
+    for fill in list(fills):
+        if abs(fill[0] - t) < FILL_MATCH * follower.period:
+            if fill[1] == downbeat:
+                fills.remove(fill)
+                return fill
+            # Tapped as the other kind of beat: the fill was wrong
+            undo_fills(fill)
+            return None
+    return None
+
+def tap(downbeat, at=None):
+    """A beat from the conductor; `at` is its click time, None for right away"""
+    if not TEMPO_FOLLOW:
+        return downbeat_at(at) if downbeat else other_beat_at(at)
+    t = time.perf_counter() if at is None else at
+    fill = take_fill(t, downbeat)
+    follower.tap(t, downbeat)
+    if fill is None:
+        return downbeat_at(at) if downbeat else other_beat_at(at)
+    fill_t, _, voices, message, _ = fill
+    if fill_t > time.perf_counter():
+        # Not heard yet: move it onto the tap
+        moved = []
+        for sound, voice_id in voices:
+            mixer.cancel(voice_id)
+            moved.append((sound, play(sound, at=at)))
+        move_beat(message, t)
+        return moved
+    return voices
+
+@app.get("/tempo")
+def get_tempo():
+    return {"tempo_follow": TEMPO_FOLLOW, **follower.state()}
+
+# Plain HTTP beats, timed by when the request arrives
+@app.post("/beat/downbeat")
+async def downbeat():
+    tap(True)
     return {"status": "ok"}
 
+@app.post("/beat/other")
+async def other_beat():
+    return {"status": "ok" if tap(False) is not None else "ignored"}
+
 # ================= RUN SERVER =================
 if __name__ == "__main__":
     print("Server running on http://127.0.0.1:8000")
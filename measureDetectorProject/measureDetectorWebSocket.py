@@ -1,37 +1,60 @@
 import os
+import sys
 import threading
 import time
 import numpy as np
 import cv2
-import base64
-from collections import deque
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import struct
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import sounddevice as sd
-from scipy.io import wavfile
+from fastapi.responses import FileResponse, Response
 import asyncio
 
+# Shared flowstate package lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flowstate.beat_predictor import PredictiveScheduler
+from flowstate.broadcaster import Broadcaster
+from flowstate.downbeat_detector import DownbeatDetector
+from flowstate.measure_synth import open_measure_audio, wav_bytes
+from flowstate.capture import GrabberSource, LatestFrameGrabber, open_capture
+from flowstate.mixer import Mixer
+from flowstate.queues import DropOldestQueue
+from flowstate.tracing import TRACE_ENABLED, Tracer
+from flowstate.workers import DetectionWorker
+
 # ================= CONFIG =================
 FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
-FPS = 10
+CAMERA_FPS = 30       # requested from the driver; detection runs at whatever it delivers
+PREVIEW_FPS = 10      # preview encode/broadcast is throttled independently
 BOTTOM_REGION_HEIGHT = 250
 MIN_TIME_BETWEEN_CLICKS = 0.3
 SMOOTHING_FRAMES = 5
+ROI_TRACKING = True   # segment only a window around the glove, full frame when lost
+KINEMATIC_TRACKING = True  # Kalman-track the glove and stamp downbeats at the boundary crossing
+CROSSING_LATENCY = 0.03    # interpolated crossing time minus the real one (exposure + readout)
+PREDICTIVE_DOWNBEATS = True  # queue the click for the predicted downbeat instead of reacting late
+DETECTION_PROCESSES = True   # detect in a worker process per session, off the event loop's GIL
 BLOCKSIZE = 256
 FS = 44100
+JPEG_QUALITY = 80
+DEFAULT_SESSION = "default"
+
+# Binary preview frame header (little endian):
+#   version u8 | flags u8 | pad u16 | frame_id u32 | capture_ts f64 | measure_count u32
+# followed by the raw JPEG bytes. Control/state messages stay JSON text.
+FRAME_PROTOCOL_VERSION = 1
+FRAME_FLAG_DOWNBEAT = 0x01
+FRAME_HEADER = struct.Struct("<BBxxIdI")
 
 BASE_DIR = os.path.dirname(__file__)
 MEASURE_WAV_PATH = os.path.join(BASE_DIR, "measure_wavs")
 FRONTEND_PATH = BASE_DIR
+TRACE_DIR = os.path.join(BASE_DIR, "traces")
 
 # ================= GLOBAL STATE =================
-pipeline_running = False
-pipeline_thread = None
-clients = set()
-active_sounds = []
-audio_lock = threading.Lock()
+# Shared by every session
+tracer = Tracer(enabled=TRACE_ENABLED)  # FLOWSTATE_TRACE=1 turns it on
 
 # ================= FASTAPI =================
 app = FastAPI()
@@ -44,148 +67,142 @@ app.mount("/measure_wavs", StaticFiles(directory=MEASURE_WAV_PATH), name="measur
 async def root():
     return FileResponse(os.path.join(FRONTEND_PATH, "index.html"))
 
+@app.get("/measures/{number}")
+def get_measure_audio(number: int):
+    """Recorded announcement if there is one, otherwise spliced from the word bank"""
+    path = os.path.join(MEASURE_WAV_PATH, f"measure_{number}.wav")
+    if os.path.exists(path):
+        return FileResponse(path, media_type="audio/wav")
+    if number not in measure_audio:
+        raise HTTPException(status_code=404, detail=f"No announcement for measure {number}")
+    return Response(wav_bytes(measure_audio[number], FS), media_type="audio/wav")
+
+@app.get("/trace")
+async def get_trace():
+    """Write the recorded spans as a Chrome/Perfetto trace and download it"""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is off; start the server with FLOWSTATE_TRACE=1")
+    path = os.path.join(TRACE_DIR, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    await asyncio.to_thread(tracer.dump, path)
+    return FileResponse(path, filename=os.path.basename(path))
+
 # ================= AUDIO FUNCTIONS =================
-def play_sound(sound):
-    with audio_lock:
-        active_sounds.append([sound, 0])
-
-def audio_callback(outdata, frames, time_info, status):
-    outdata[:] = 0
-    with audio_lock:
-        finished = []
-        for i, sound in enumerate(active_sounds):
-            data, pos = sound
-            n = min(len(data)-pos, frames)
-            outdata[:n, 0] += data[pos:pos+n]
-            sound[1] += n
-            if sound[1] >= len(data):
-                finished.append(i)
-        for i in reversed(finished):
-            active_sounds.pop(i)
+mixer = Mixer(fs=FS, blocksize=BLOCKSIZE, tracer=tracer)
+
+def play_sound(sound, at=None, trace_id=None):
+    """Queue a sound, optionally for an exact time.perf_counter() time"""
+    mixer.play(sound, at=at, trace_id=trace_id)
+
+def generate_click(freq, ms, amp=0.6):
+    t = np.linspace(0, ms/1000, int(FS*ms/1000), False)
+    return (amp * np.sin(2*np.pi*freq*t)).astype(np.float32)
+
+click_downbeat = generate_click(1500, 25)
 
 # Start audio stream
-stream = sd.OutputStream(
-    samplerate=FS,
-    channels=1,
-    blocksize=BLOCKSIZE,
-    callback=audio_callback
-)
-stream.start()
+stream = mixer.start()
 
 # ================= LOAD MEASURE AUDIO =================
-measure_audio = {}
-for file_name in os.listdir(MEASURE_WAV_PATH):
-    if file_name.startswith("measure_") and file_name.endswith(".wav"):
-        measure_num = int(file_name.split("_")[1].split(".")[0])
-        path = os.path.join(MEASURE_WAV_PATH, file_name)
-        fs_data, data = wavfile.read(path)
-        if data.dtype == np.int16:
-            data = data.astype(np.float32) / 32768.0
-        if data.ndim > 1:
-            data = data[:,0]  # stereo -> mono
-        measure_audio[measure_num] = data
-print(f"Loaded measure audio files: {list(measure_audio.keys())}")
+# Shared memory-mapped bank of cues prepared for FS, built from measure_wavs
+# on first run; measures are decoded to float32 on demand, and ones the bank
+# lacks are spliced from the word bank in measure_words/
+measure_audio = open_measure_audio(MEASURE_WAV_PATH, sample_rate=FS)
+print(f"Measure announcements: {measure_audio.describe()}")
+
+def downbeat_sounds(measure):
+    """Click, plus the measure announcement every 4 measures"""
+    sounds = [click_downbeat]
+    if (measure - 1) % 4 == 0 and measure in measure_audio:
+        sounds.append(measure_audio[measure])
+    return sounds
 
 # ================= HELPER FUNCTIONS =================
-def encode_frame(frame) -> str:
-    _, buffer = cv2.imencode(".jpg", frame)
-    return base64.b64encode(buffer).decode("utf-8")
-
-async def broadcast_state(measure_count, downbeat_triggered, frame_encoded):
-    """Send state to all WebSocket clients"""
-    to_remove = set()
-    for ws in clients:
-        try:
-            await ws.send_json({
-                "type": "frame",
-                "measure_count": measure_count,
-                "downbeat": downbeat_triggered,
-                "frame": frame_encoded
-            })
-        except:
-            to_remove.add(ws)
-    for ws in to_remove:
-        clients.remove(ws)
+def encode_frame(frame) -> bytes:
+    _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buffer.tobytes()
+
+def pack_frame(frame_id, capture_ts, measure_count, downbeat_triggered, jpeg) -> bytes:
+    """Binary preview message: fixed header + raw JPEG"""
+    flags = FRAME_FLAG_DOWNBEAT if downbeat_triggered else 0
+    header = FRAME_HEADER.pack(FRAME_PROTOCOL_VERSION, flags, frame_id & 0xFFFFFFFF,
+                               capture_ts, measure_count)
+    return header + jpeg
 
 # ---------------- CAMERA OPEN ----------------
-def open_camera():
-    for backend in [cv2.CAP_DSHOW, cv2.CAP_MSMF, cv2.CAP_ANY]:
-        cap = cv2.VideoCapture(0, backend)
-        if cap.isOpened():
-            print(f"Camera opened using backend {backend}")
-            return cap
-        cap.release()
-    return None
-
-# ================= METRONOME PIPELINE =================
-def metronome_pipeline(loop):
-    global pipeline_running
-
-    cap = open_camera()
+def open_camera_source(index=0):
+    """Native backend, one driver buffer, and a grabber that only hands out the newest frame"""
+    cap = open_capture(index, FRAME_WIDTH, FRAME_HEIGHT, CAMERA_FPS)
     if cap is None:
-        for ws in clients:
-            asyncio.run_coroutine_threadsafe(
-                ws.send_json({"type": "error", "message": "Could not open webcam"}),
-                loop
-            )
-        pipeline_running = False
-        return
-
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
-
-    wrist_history = deque(maxlen=SMOOTHING_FRAMES)
-    prev_time = None
-    in_bottom_region = False
-    measure_count = 1
-
-    try:
-        while pipeline_running:
-            ret, frame = cap.read()
-            if not ret:
-                time.sleep(0.1)
+        return None
+    return GrabberSource(LatestFrameGrabber(cap))
+
+# ================= SESSIONS =================
+# One session per room: its own camera, pipeline threads, detector state,
+# subscribers and measure counter. The audio bank, mixer and tracer are
+# shared by every session in the process.
+#
+# Each pipeline is three stages joined by drop-oldest queues:
+#   capture thread -> detection (pipeline thread) -> preview encode thread
+# Detection never waits on JPEG encoding or the network, and a slow stage
+# only ever sees the newest frame instead of a growing backlog.
+
+class Session:
+    def __init__(self, session_id, camera=0):
+        self.id = session_id
+        self.camera = camera
+        self.broadcaster = Broadcaster(tracer=tracer)  # frames latest-wins, events guaranteed
+        self.running = False
+        self.thread = None
+        self.measure_count = 1
+
+    def status(self):
+        return {"session": self.id, "camera": self.camera, "running": self.running,
+                "measure_count": self.measure_count, "clients": len(self.broadcaster)}
+
+    def start(self, source=None):
+        """Start the pipeline on `source` (any frame source), this session's camera by default"""
+        if self.running:
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(source,),
+                                       name=f"pipeline-{self.id}", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop the pipeline and wait for it; blocks, so call via asyncio.to_thread"""
+        self.running = False
+        thread, self.thread = self.thread, None
+        if thread is not None:
+            thread.join()
+
+    # ---------------- STAGES ----------------
+    END_OF_STREAM = object()  # put on the frame queue when a file or replay runs out
+
+    def capture_stage(self, source, frames_q):
+        read_start = time.perf_counter()
+        for frame_id, t, frame in source:
+            if not self.running:
+                break
+            arrived = time.perf_counter()
+            tracer.complete("capture", read_start, arrived, frame_id, session=self.id)
+            # Cameras stamp frames on the perf_counter() clock (the driver or
+            # grabber timestamp); for files the arrival time is all there is
+            capture_perf = t if source.perf_clock else arrived
+            capture_ts = time.time() - (arrived - capture_perf)
+            frames_q.put((frame_id, capture_ts, capture_perf, arrived, t, frame))
+            read_start = time.perf_counter()
+        if self.running:
+            frames_q.put(self.END_OF_STREAM)
+
+    def preview_stage(self, preview_q):
+        interval = 1 / PREVIEW_FPS
+        while self.running:
+            item = preview_q.get(timeout=0.1)
+            if item is None:
                 continue
-
-            frame = cv2.flip(frame, 1)
-            downbeat_triggered = False
-
-            # RED DETECTION
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            lower_red1 = np.array([0,120,70])
-            upper_red1 = np.array([10,255,255])
-            lower_red2 = np.array([170,120,70])
-            upper_red2 = np.array([180,255,255])
-            mask = cv2.inRange(hsv, lower_red1, upper_red1) | cv2.inRange(hsv, lower_red2, upper_red2)
-            mask = cv2.GaussianBlur(mask, (5,5), 0)
-
-            contours,_ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            if contours:
-                cnt = max(contours, key=cv2.contourArea)
-                if cv2.contourArea(cnt) > 200:
-                    hull = cv2.convexHull(cnt)
-                    bottommost = tuple(hull[hull[:,:,1].argmax()][0])
-                    wrist_history.append(bottommost)
-
-                    if len(wrist_history) >= 2:
-                        smoothed_y = int(np.mean([p[1] for p in wrist_history]))
-                        prev_y = int(np.mean([p[1] for p in list(wrist_history)[:-1]]))
-                        dy = smoothed_y - prev_y
-
-                        now_in_bottom = smoothed_y > FRAME_HEIGHT - BOTTOM_REGION_HEIGHT
-                        new_downbeat = now_in_bottom and not in_bottom_region and dy > 0
-                        in_bottom_region = now_in_bottom
-
-                        if new_downbeat:
-                            now = time.perf_counter()
-                            if prev_time is None or (now - prev_time) > MIN_TIME_BETWEEN_CLICKS:
-                                downbeat_triggered = True
-                                prev_time = now
-                                measure_count += 1
-
-                                # Play measure audio every 4 measures
-                                if (measure_count - 1) % 4 == 0 and measure_count in measure_audio:
-                                    play_sound(measure_audio[measure_count])
-                                    print(f"Playing measure audio for measure {measure_count}")
+            started = time.perf_counter()
+            frame_id, capture_ts, frame, measure_count, downbeat_triggered = item
 
             # Overlay
             cv2.rectangle(frame, (0, FRAME_HEIGHT - BOTTOM_REGION_HEIGHT),
@@ -193,55 +210,191 @@ def metronome_pipeline(loop):
             cv2.putText(frame, f"Measures: {measure_count}", (10,40),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2)
 
-            # Broadcast via main loop safely
-            asyncio.run_coroutine_threadsafe(
-                broadcast_state(measure_count, downbeat_triggered, encode_frame(frame)),
-                loop
-            )
-            time.sleep(1/FPS)
+            packet = pack_frame(frame_id, capture_ts, measure_count, downbeat_triggered,
+                                encode_frame(frame))
+            tracer.complete("preview encode", started, time.perf_counter(), frame_id, session=self.id)
+            self.broadcaster.publish_frame_threadsafe(packet, trace_id=frame_id)
+
+            # Throttle the preview only; detection keeps running meanwhile
+            remaining = interval - (time.perf_counter() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def run(self, source=None):
+        detector_config = dict(bottom_region_height=BOTTOM_REGION_HEIGHT,
+                               min_time_between_clicks=MIN_TIME_BETWEEN_CLICKS,
+                               smoothing_frames=SMOOTHING_FRAMES,
+                               roi_tracking=ROI_TRACKING, kinematic=KINEMATIC_TRACKING,
+                               tracer=tracer)
+        if DETECTION_PROCESSES:
+            # Spawn the worker before any frame is captured: a realtime
+            # source would otherwise drop frames while it starts up
+            detector = DetectionWorker(name=f"detect {self.id}", **detector_config)
+            try:
+                detector.start()
+            except RuntimeError as e:
+                self.broadcaster.publish_event_threadsafe({"type": "error", "message": str(e)})
+                self.running = False
+                return
+        else:
+            detector = DownbeatDetector(**detector_config)
+
+        if source is None:
+            source = open_camera_source(self.camera)
+            if source is None:
+                if DETECTION_PROCESSES:
+                    detector.close()
+                self.broadcaster.publish_event_threadsafe(
+                    {"type": "error", "message": f"Could not open camera {self.camera}"})
+                self.running = False
+                return
+
+        frames_q = DropOldestQueue(maxsize=2)
+        preview_q = DropOldestQueue(maxsize=1)
+        stages = [
+            threading.Thread(target=self.capture_stage, args=(source, frames_q), daemon=True),
+            threading.Thread(target=self.preview_stage, args=(preview_q,), daemon=True),
+        ]
+        for t in stages:
+            t.start()
+
+        scheduler = None
+        if PREDICTIVE_DOWNBEATS:
+            scheduler = (PredictiveScheduler(mixer, detection_latency=CROSSING_LATENCY)
+                         if KINEMATIC_TRACKING else PredictiveScheduler(mixer))
+        self.measure_count = 1
+        ended = False
 
-    finally:
-        cap.release()
+        try:
+            while self.running:
+                item = frames_q.get(timeout=0.1)
+                if item is None:
+                    continue
+                if item is self.END_OF_STREAM:
+                    ended = True
+                    break
+                # capture_t is on the source's clock (media time for files),
+                # capture_perf the capture time on perf_counter() for the audio
+                # scheduling, arrived when the frame reached this process
+                frame_id, capture_ts, capture_perf, arrived, capture_t, frame = item
+                tracer.complete("detect queue", arrived, time.perf_counter(), frame_id,
+                                session=self.id)
+
+                frame = cv2.flip(frame, 1)
+                decision = detector.process(frame, capture_t, frame_id)
+                if decision is None:
+                    continue  # worker fell behind and the frame was dropped
+                measure_count = decision.measure_count
+                if scheduler is not None:
+                    # Predicted downbeats the detector never saw were still announced
+                    measure_count += scheduler.unconfirmed_measures
+                self.measure_count = measure_count
+
+                if decision.downbeat:
+                    # How long before this frame the glove actually crossed the line
+                    since_crossing = capture_t - decision.downbeat_t
+                    # Already queued for the predicted time? Otherwise play now.
+                    covered = (scheduler is not None
+                               and scheduler.on_detected(capture_perf - since_crossing))
+                    tracer.instant("downbeat", frame_id=frame_id, measure=measure_count,
+                                   predicted=covered, session=self.id)
+                    if not covered:
+                        for sound in downbeat_sounds(measure_count):
+                            play_sound(sound, trace_id=frame_id)
+
+                # Queue, move or cancel the click for the next predicted downbeat
+                if scheduler is not None:
+                    schedule_start = time.perf_counter()
+                    scheduler.update(time.perf_counter(), downbeat_sounds, measure_count + 1,
+                                     y=decision.smoothed_y, vy=decision.vy,
+                                     boundary=frame.shape[0] - BOTTOM_REGION_HEIGHT,
+                                     trace_id=frame_id)
+                    tracer.complete("schedule", schedule_start, time.perf_counter(), frame_id,
+                                    session=self.id)
+
+                # The downbeat goes out as its own JSON event straight from the
+                # detection stage so it is never held back by preview throttling.
+                if decision.downbeat:
+                    self.broadcaster.publish_event_threadsafe({
+                        "type": "downbeat",
+                        "frame_id": frame_id,
+                        "measure_count": measure_count,
+                        "timestamp": capture_ts - since_crossing
+                    }, trace_id=frame_id)
+                preview_q.put((frame_id, capture_ts, frame, measure_count, decision.downbeat))
+
+        finally:
+            self.running = False
+            source.stop()
+            for t in stages:
+                t.join()
+            source.close()
+            if DETECTION_PROCESSES:
+                detector.close()
+            skipped = frames_q.dropped + getattr(source, "skipped", 0)
+            if skipped:
+                print(f"[{self.id}] Detection skipped {skipped} stale frames")
+            if ended:
+                print(f"[{self.id}] Source ended")
+                self.broadcaster.publish_event_threadsafe(
+                    {"type": "status", **self.status(), "reason": "end of stream"})
+
+
+sessions = {}   # session id -> Session
+
+def get_session(session_id, camera=0):
+    session = sessions.get(session_id)
+    if session is None:
+        session = sessions[session_id] = Session(session_id, camera)
+    return session
+
+@app.get("/sessions")
+async def list_sessions():
+    return [session.status() for session in sessions.values()]
 
 # ================= WEBSOCKET =================
+# /ws/metronome joins the default session; /ws/metronome/<room>?camera=1 a
+# named one (the camera index is taken from whoever creates the session).
 @app.websocket("/ws/metronome")
-async def websocket_endpoint(ws: WebSocket):
-    global pipeline_running, pipeline_thread
+@app.websocket("/ws/metronome/{session_id}")
+async def websocket_endpoint(ws: WebSocket, session_id: str = DEFAULT_SESSION):
     await ws.accept()
-    clients.add(ws)
-    print("WebSocket connected")
-
-    # Pass main loop to pipeline thread
-    main_loop = asyncio.get_running_loop()
+    camera = ws.query_params.get("camera", "0")
+    session = get_session(session_id, int(camera) if camera.isdigit() else 0)
+    session.broadcaster.add(ws)
+    print(f"WebSocket connected to session {session_id}")
+    session.broadcaster.send_to(ws, {"type": "status", **session.status()})
 
     try:
         while True:
             msg = await ws.receive_text()
-            if msg == "start" and not pipeline_running:
-                pipeline_running = True
-                pipeline_thread = threading.Thread(target=metronome_pipeline, args=(main_loop,), daemon=True)
-                pipeline_thread.start()
-                await ws.send_json({"type":"status", "running":True})
-            elif msg == "stop" and pipeline_running:
-                pipeline_running = False
-                if pipeline_thread:
-                    pipeline_thread.join()
-                await ws.send_json({"type":"status", "running":False})
+            if msg == "start":
+                session.start()
+                session.broadcaster.publish_event({"type":"status", **session.status()})
+            elif msg == "stop" and session.running:
+                await asyncio.to_thread(session.stop)
+                session.broadcaster.publish_event({"type":"status", **session.status()})
 
     except WebSocketDisconnect:
-        print("WebSocket disconnected")
-        pipeline_running = False
-        if pipeline_thread:
-            pipeline_thread.join()
+        print(f"WebSocket disconnected from session {session_id}")
 
     except Exception as e:
         print("WebSocket error:", e)
-        pipeline_running = False
-        if pipeline_thread:
-            pipeline_thread.join()
-        await ws.send_json({"type":"error","message":str(e)})
+        # Sent directly: removing the client below cancels its sender task
+        try:
+            await ws.send_json({"type":"error","message":str(e)})
+        except Exception:
+            pass
+
+    finally:
+        session.broadcaster.remove(ws)
+        # The last subscriber leaving ends the session
+        if not len(session.broadcaster):
+            await asyncio.to_thread(session.stop)
+            if not len(session.broadcaster) and sessions.get(session_id) is session:
+                del sessions[session_id]
 
 # ================= RUN =================
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("backend:app", host="127.0.0.1", port=8001)
+    uvicorn.run(app, host="127.0.0.1", port=8001)